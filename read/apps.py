@@ -1,5 +1,5 @@
 from django.apps import AppConfig
-from decouple import config
+from decouple import config, Csv
 import os
 
 class ReadConfig(AppConfig):
@@ -7,11 +7,19 @@ class ReadConfig(AppConfig):
     name = 'read'
 
     def ready(self):
-        from utils.kidwhisper import load_model
-        from utils.mispronunciation_detection.mispronunciation_detection import load_md_model
+        # Models load on first use; PRELOAD_MODELS names any that should be
+        # resident from startup instead (e.g. "whisper-tiny,whisper-small")
+        preload = config("PRELOAD_MODELS", default="", cast=Csv())
 
-        load_model()
-        load_md_model()
+        if preload:
+            # Importing these registers their models
+            import utils.kidwhisper
+            import utils.silero_vad
+            import utils.mispronunciation_detection.mispronunciation_detection
+            from utils.model_registry import registry
+
+            for name in preload:
+                registry.get(name)
 
         device = config("device")
 
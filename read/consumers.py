@@ -1,18 +1,25 @@
-import ffmpeg
 import json
 import asyncio
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from utils.kidwhisper import transcribe_waveform_direct
-from utils.silero_vad import silero_vad_steam
-from utils.conversions import convert_webm_to_wav
-
-from utils.story_generation.InitialParasLinked import run_inital_paras
-from utils.story_generation.MatchLinked import run_match
-from utils.story_generation.StoryGenLinked import run_story_gen
-from utils.story_generation.NoOutlineGenLinked import run_no_outline_gen
+from utils.streaming_asr import StreamingTranscriber
+from utils.classroom_wav2vec import StreamingCTCTranscriber
+from utils.silero_vad import StreamingVAD, vad_batcher
+from utils.conversions import create_stream_decoder, DecodeError
+from utils.audio_buffer import AudioRingBuffer
+from utils.inference_executor import run_inference
+
+from utils.story_generation.GenerateStory import generate_story
 from utils.compare import compare_strings
 
 CHUNK_THRESHOLD = 5
+STREAM_FORMATS = ("webm", "pcm16")
+
+# Noisy classrooms are transcribed by the chunked CTC model, quiet ones by Whisper
+STREAMING_TRANSCRIBERS = {
+    "Quiet": StreamingTranscriber,
+    "Noisy": StreamingCTCTranscriber,
+}
 
 class LatestTaskRunner:
     def __init__(self):
@@ -34,9 +41,20 @@ class LatestTaskRunner:
 
 class AudioStreamConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        query = parse_qs(self.scope["query_string"].decode())
+        self.stream_format = query.get("format", ["webm"])[0]
+        self.environ_type = query.get("environ_type", ["Quiet"])[0]
+
+        if self.stream_format not in STREAM_FORMATS or self.environ_type not in STREAMING_TRANSCRIBERS:
+            await self.close()
+            return
+
         await self.accept()
-        self.chunk_buffer = []
-        self.last_speaking_time = 0
+        self.decoder = create_stream_decoder(self.stream_format)
+        self.buffer = AudioRingBuffer()
+        self.vad = StreamingVAD()
+        self.transcriber = STREAMING_TRANSCRIBERS[self.environ_type]()
+        self.speaking = False
         self.running_chunks = 0
         self.paragraph = 0
 
@@ -44,13 +62,23 @@ class AudioStreamConsumer(AsyncWebsocketConsumer):
         
         self.task_runner = LatestTaskRunner()
 
+        if self.stream_format != "webm":
+            await self.send(text_data=json.dumps({
+                "format": self.stream_format
+            }))
+
     async def disconnect(self, close_code):
-        pass
+        if hasattr(self, "decoder"):
+            self.decoder.close()
 
     async def receive(self, text_data=None, bytes_data=None):
         if text_data == "clear":
-            self.chunk_buffer = []
-            self.last_speaking_time = 0
+            self.decoder.close()
+            self.decoder = create_stream_decoder(self.stream_format)
+            self.buffer.clear()
+            self.vad.reset()
+            self.transcriber = STREAMING_TRANSCRIBERS[self.environ_type](self.buffer.total)
+            self.speaking = False
             self.running_chunks = 0
             self.task_runner = LatestTaskRunner()
             self.paragraph = self.paragraph + 1
@@ -59,48 +87,50 @@ class AudioStreamConsumer(AsyncWebsocketConsumer):
 
         elif bytes_data:
             print("received")
-            self.chunk_buffer.append(bytes_data)
 
-            if len(self.chunk_buffer) >= 1:
-                combined = b"".join(self.chunk_buffer)
-                # self.chunk_buffer = []
+            try:
+                samples = await run_inference("decode", self.decoder.decode, bytes_data)
+            except DecodeError as e:
+                print("🔴 Audio decoding error:\n", e)
+                samples = None
 
-                speaking = self.run_vad_on_chunk(combined)
+            if samples is not None and len(samples) > 0:
+                self.buffer.write(samples)
+                self.speaking = await self.run_vad_on_chunk(samples)
 
-                await self.send(text_data=json.dumps({
-                    "speaking": speaking
-                }))
+            await self.send(text_data=json.dumps({
+                "speaking": self.speaking
+            }))
 
-    def run_vad_on_chunk(self, audio_bytes: bytes, sample_rate=16000):
-        try:
-            timestamps, waveform = silero_vad_steam(audio_bytes)
-            
-            if len(timestamps) > 0 and timestamps[-1]["end"] > self.last_speaking_time:
-                print("speaking")
-                self.last_speaking_time = timestamps[-1]["end"]
-                self.running_chunks += 1
-
-                if self.running_chunks >= CHUNK_THRESHOLD:
-                    self.running_chunks = 0
-                    self.task_runner.add_task(waveform, self.transcribe_and_send)
-
-                return True
-            else:
-                if self.running_chunks > 0:
-                    self.task_runner.add_task(waveform, self.transcribe_and_send)
-                
+    async def run_vad_on_chunk(self, samples):
+        for event in await vad_batcher.process(self.vad, samples):
+            print("VAD:", event)
+
+        if self.vad.triggered:
+            print("speaking")
+            self.running_chunks += 1
+
+            if self.running_chunks >= CHUNK_THRESHOLD:
                 self.running_chunks = 0
-                return False
+                self.task_runner.add_task(self.buffer.total, self.transcribe_and_send)
 
-        except ffmpeg.Error as e:
-            print("🔴 FFmpeg decoding error:\n", e.stderr.decode(errors="ignore"))
+            return True
+        else:
+            if self.running_chunks > 0:
+                self.task_runner.add_task(self.buffer.total, self.transcribe_and_send)
+            
+            self.running_chunks = 0
             return False
     
-    async def transcribe_and_send(self, waveform):
+    async def transcribe_and_send(self, end):
 
         print("TRANSCRIBING AUDIO")
-        transcript = transcribe_waveform_direct(waveform, 16000, "Quiet")
-        transcript = transcript[0]
+        transcriber = self.transcriber
+        transcript = await run_inference(transcriber.inference_queue, transcriber.update, self.buffer, end)
+
+        # Audio behind the committed words is never decoded again
+        if transcriber is self.transcriber:
+            self.buffer.commit(transcriber.offset)
 
         num_words = len(transcript.split(" "))
 
@@ -124,9 +154,6 @@ class GenerateStoryConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data=None, bytes_data=None):
         if text_data:
             mistakes = json.loads(text_data)
-            run_inital_paras(mistakes)
-            run_match()
-            run_story_gen()
-            paragraphs = run_no_outline_gen()
+            paragraphs = await run_inference("story", generate_story, mistakes)
 
             await self.send(text_data=json.dumps(paragraphs))
\ No newline at end of file
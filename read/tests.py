@@ -1,3 +1,268 @@
-from django.test import TestCase
+import re
+import struct
+import random
+import numpy as np
 
-# Create your tests here.
+from unittest import mock
+from django.test import SimpleTestCase
+
+from utils.conversions import DecodeError, PcmFrameDecoder, WebmDemuxer, PCM_FRAME_HEADER, WEBM_MAX_BUFFER_BYTES
+from utils.forced_alignment import align_words
+from utils.mispronunciation_detection.alignment import align_batch
+from utils.mispronunciation_detection.phoneme_inventory import PHONEME_MAP, PHONEMES, tokenize
+
+def reference_align(gt_phonemes, pred_phonemes):
+    """The per word list-of-lists DP align_batch replaced, kept as the reference."""
+    n = len(gt_phonemes)
+    m = len(pred_phonemes)
+
+    dp = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n + 1):
+        dp[i][0] = i
+    for j in range(m + 1):
+        dp[0][j] = j
+
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cost = 0 if gt_phonemes[i - 1] == pred_phonemes[j - 1] else 1
+            dp[i][j] = min(dp[i - 1][j] + 1, dp[i][j - 1] + 1, dp[i - 1][j - 1] + cost)
+
+    alignment = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and gt_phonemes[i - 1] == pred_phonemes[j - 1]:
+            alignment.append(('match', gt_phonemes[i - 1], pred_phonemes[j - 1]))
+            i -= 1
+            j -= 1
+        elif i > 0 and j > 0 and dp[i][j] == dp[i - 1][j - 1] + 1:
+            alignment.append(('substitution', gt_phonemes[i - 1], pred_phonemes[j - 1]))
+            i -= 1
+            j -= 1
+        elif i > 0 and dp[i][j] == dp[i - 1][j] + 1:
+            alignment.append(('deletion', gt_phonemes[i - 1], None))
+            i -= 1
+        elif j > 0 and dp[i][j] == dp[i][j - 1] + 1:
+            alignment.append(('insertion', None, pred_phonemes[j - 1]))
+            j -= 1
+    return alignment[::-1]
+
+class AlignBatchTests(SimpleTestCase):
+    def assertMatchesReference(self, gt_words, pred_words):
+        for gt, pred, alignment in zip(gt_words, pred_words, align_batch(gt_words, pred_words)):
+            alignment = [
+                (op, None if g is None else int(g), None if p is None else int(p))
+                for op, g, p in alignment
+            ]
+            self.assertEqual(alignment, reference_align(gt, pred), (gt, pred))
+
+    def test_matches_reference_on_random_words(self):
+        rng = random.Random(0)
+
+        # A small alphabet makes ties, and so the tie-breaking order, common
+        for _ in range(300):
+            words = rng.randint(1, 12)
+            gt_words = [[rng.randint(0, 4) for _ in range(rng.randint(0, 9))] for _ in range(words)]
+            pred_words = [[rng.randint(0, 4) for _ in range(rng.randint(0, 9))] for _ in range(words)]
+            self.assertMatchesReference(gt_words, pred_words)
+
+    def test_empty_words(self):
+        self.assertMatchesReference([[], [1, 2], []], [[3], [], []])
+        self.assertEqual(align_batch([], []), [])
+
+def reference_split(phoneme_string):
+    """The regex split tokenize replaced, kept as the reference."""
+    pattern = '|'.join(re.escape(p) for p in sorted(PHONEME_MAP.keys(), key=len, reverse=True))
+    return [m.group(0) for m in re.finditer(pattern, phoneme_string)]
+
+class TokenizeTests(SimpleTestCase):
+    def test_matches_reference_on_random_strings(self):
+        rng = random.Random(0)
+        # Whole phonemes, their single characters and characters outside the inventory
+        pieces = PHONEMES + sorted(set("".join(PHONEMES))) + list("qøʲː ")
+
+        for _ in range(5000):
+            phoneme_string = "".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+            self.assertEqual([PHONEMES[i] for i in tokenize(phoneme_string)], reference_split(phoneme_string), phoneme_string)
+
+    def test_longest_match(self):
+        self.assertEqual([PHONEMES[i] for i in tokenize("t͡ʃaɪld")], ["t͡ʃ", "aɪ", "l", "d"])
+
+def ebml_element(element_id, payload):
+    """Encodes an element with a one byte size, enough for the test streams."""
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + bytes([0x80 | len(payload)]) + payload
+
+def webm_stream(packets):
+    """A MediaRecorder style stream: unknown sized Segment and Cluster, one Opus track."""
+    track_entry = ebml_element(0xD7, b"\x01") + ebml_element(0x86, b"A_OPUS")
+    stream = ebml_element(0x1A45DFA3, ebml_element(0x4282, b"webm"))
+    stream += bytes.fromhex("18538067 01FFFFFFFFFFFFFF")
+    stream += ebml_element(0x1654AE6B, ebml_element(0xAE, track_entry))
+    stream += bytes.fromhex("1F43B675 01FFFFFFFFFFFFFF")
+    for packet in packets:
+        # Track 1, relative timecode 0, keyframe flag
+        stream += ebml_element(0xA3, b"\x81\x00\x00\x80" + packet)
+    return stream
+
+class WebmDemuxerTests(SimpleTestCase):
+    packets = [f"packet {i}".encode() for i in range(10)]
+
+    def feed_bytewise(self, demuxer, data):
+        # Like the consumer, a chunk that only yields errors is dropped and the stream goes on
+        packets = []
+        for i in range(len(data)):
+            try:
+                packets += demuxer.feed(data[i:i + 1])
+            except DecodeError:
+                pass
+        return packets
+
+    def test_bytewise_matches_whole(self):
+        stream = webm_stream(self.packets)
+
+        self.assertEqual(WebmDemuxer().feed(stream), self.packets)
+        demuxer = WebmDemuxer()
+        self.assertEqual(self.feed_bytewise(demuxer, stream), self.packets)
+        self.assertEqual(demuxer.codec_id, "A_OPUS")
+        self.assertEqual(len(demuxer.buffer), 0)
+
+    def test_leading_garbage(self):
+        stream = b"\x00" * 5 + webm_stream(self.packets)
+        self.assertEqual(WebmDemuxer().feed(stream), self.packets)
+
+        self.assertEqual(self.feed_bytewise(WebmDemuxer(), stream), self.packets)
+
+    def test_unknown_size_element(self):
+        stream = webm_stream(self.packets)
+        corrupt = stream.replace(ebml_element(0xA3, b"\x81\x00\x00\x80packet 3"), bytes.fromhex("A3FF"))
+
+        self.assertEqual(WebmDemuxer().feed(corrupt), self.packets[:3] + self.packets[4:])
+
+    def test_oversized_element_does_not_stall(self):
+        stream = webm_stream(self.packets)
+        # A SimpleBlock claiming 256 MB in place of packet 3
+        corrupt = stream.replace(ebml_element(0xA3, b"\x81\x00\x00\x80packet 3"), bytes.fromhex("A31FFFFFF0"))
+
+        for packets in (WebmDemuxer().feed(corrupt), self.feed_bytewise(WebmDemuxer(), corrupt)):
+            self.assertEqual(packets[:3], self.packets[:3])
+            self.assertEqual(packets, self.packets[:3] + self.packets[4:])
+
+    def test_buffer_limit(self):
+        demuxer = WebmDemuxer()
+        demuxer.feed(webm_stream([])[:-1])
+
+        with self.assertRaises(DecodeError):
+            demuxer.feed(b"\x00" * WEBM_MAX_BUFFER_BYTES)
+        self.assertEqual(len(demuxer.buffer), 0)
+
+def pcm_frame(sequence, samples):
+    return PCM_FRAME_HEADER.pack(sequence, len(samples)) + struct.pack(f"<{len(samples)}h", *samples)
+
+class PcmFrameDecoderTests(SimpleTestCase):
+    def test_in_order(self):
+        decoder = PcmFrameDecoder()
+
+        np.testing.assert_array_equal(decoder.decode(pcm_frame(0, [16384, -16384])), [0.5, -0.5])
+        np.testing.assert_array_equal(decoder.decode(pcm_frame(1, [8192])), [0.25])
+
+    def test_gap_is_filled_with_silence(self):
+        decoder = PcmFrameDecoder()
+        decoder.decode(pcm_frame(7, [1, 2, 3]))
+
+        # Frames 8 and 9 are lost, each as long as frame 7
+        samples = decoder.decode(pcm_frame(10, [16384, 16384]))
+        np.testing.assert_array_equal(samples, [0] * 6 + [0.5, 0.5])
+        self.assertEqual(samples.dtype, np.float32)
+
+    def test_duplicate_is_dropped(self):
+        decoder = PcmFrameDecoder()
+        decoder.decode(pcm_frame(3, [1, 2]))
+
+        self.assertEqual(len(decoder.decode(pcm_frame(3, [1, 2]))), 0)
+        self.assertEqual(len(decoder.decode(pcm_frame(4, [1, 2]))), 2)
+
+class FakeTokenizer:
+    vocab = {token: i for i, token in enumerate(["<pad>", "|", "a", "b", "c", "d", "g", "i", "o", "t"])}
+    pad_token_id = 0
+    word_delimiter_token = "|"
+
+    def get_vocab(self):
+        return self.vocab
+
+class FakeProcessor:
+    """Just the tokenizer and CTC greedy decode align_words uses."""
+    tokenizer = FakeTokenizer()
+
+    def decode(self, ids):
+        tokens = list(self.tokenizer.vocab)
+        text = []
+        previous = None
+        for i in ids:
+            if i != previous and i != self.tokenizer.pad_token_id:
+                text.append(" " if tokens[i] == "|" else tokens[i])
+            previous = i
+        return "".join(text)
+
+def posteriors(frames, peak=0.9):
+    """Log posteriors giving each frame's token (or a (token, p) pair) most of the mass."""
+    vocab = FakeTokenizer.vocab
+    log_probs = np.empty((len(frames), len(vocab)))
+
+    for t, frame in enumerate(frames):
+        token, p = frame if isinstance(frame, tuple) else (frame, peak)
+        log_probs[t] = np.log((1 - p) / (len(vocab) - 1))
+        log_probs[t, vocab[token]] = np.log(p)
+
+    return log_probs
+
+@mock.patch("utils.forced_alignment.get_processor", FakeProcessor)
+class AlignWordsTests(SimpleTestCase):
+    def assertTimings(self, timings, expected):
+        self.assertEqual([timing["word"] for timing in timings], [word for word, _, _ in expected])
+        for timing, (_, start, end) in zip(timings, expected):
+            self.assertAlmostEqual(timing["start"], start)
+            self.assertAlmostEqual(timing["end"], end)
+
+    def test_correct(self):
+        log_probs = posteriors(["<pad>", "c", "a", "t", "|", "d", "o", "o", "g", "<pad>"])
+        alignment, timings = align_words(["cat", "dog"], log_probs)
+
+        self.assertEqual(alignment, [("cat", "cat", "correct"), ("dog", "dog", "correct")])
+        self.assertTimings(timings, [("cat", 0.02, 0.08), ("dog", 0.1, 0.18)])
+
+    def test_repeated_character(self):
+        # A doubled letter needs a blank between its two characters
+        log_probs = posteriors(["b", "o", "<pad>", "o", "t"])
+        alignment, _ = align_words(["boot"], log_probs)
+
+        self.assertEqual(alignment, [("boot", "boot", "correct")])
+
+    def test_substitution(self):
+        log_probs = posteriors(["<pad>", "c", "o", "t", "<pad>"])
+        alignment, timings = align_words(["cat"], log_probs)
+
+        self.assertEqual(alignment, [("cat", "cot", "substitution")])
+        self.assertTimings(timings, [("cat", 0.02, 0.08)])
+
+    def test_deletion(self):
+        log_probs = posteriors(["c", "a", "t", "|", "<pad>", "|", "d", "o", "g"])
+        alignment, timings = align_words(["cat", "big", "dog"], log_probs)
+
+        self.assertEqual(alignment, [("cat", "cat", "correct"), ("big", None, "deletion"), ("dog", "dog", "correct")])
+        self.assertTimings(timings, [("cat", 0.0, 0.06), ("dog", 0.12, 0.18)])
+
+    def test_insertion(self):
+        log_probs = posteriors(["c", "a", "t", "|", "b", "i", "g", "|", "d", "o", "g"])
+        alignment, timings = align_words(["cat", "dog"], log_probs)
+
+        self.assertEqual(alignment, [("cat", "cat", "correct"), (None, "big", "insertion"), ("dog", "dog", "correct")])
+        self.assertTimings(timings, [("cat", 0.0, 0.06), ("dog", 0.16, 0.22)])
+
+    def test_zero_frames(self):
+        alignment, timings = align_words(["cat", "dog"], posteriors([]))
+
+        self.assertEqual(alignment, [("cat", None, "deletion"), ("dog", None, "deletion")])
+        self.assertEqual(timings, [])
+
+    def test_empty_words(self):
+        self.assertEqual(align_words([], posteriors(["<pad>", "d", "o", "g"])), ([(None, "dog", "insertion")], []))
+        self.assertEqual(align_words([], posteriors([])), ([], []))
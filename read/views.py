@@ -1,27 +1,38 @@
 from rest_framework.decorators import api_view
 from rest_framework.status import HTTP_200_OK
 from rest_framework.response import Response
+from asgiref.sync import async_to_sync
 
 import json
 import torch
 import torchaudio
-import numpy as np
 import time
 
 from utils.compare import compare_strings, check_missing_words, normalize_text
-from utils.kidwhisper import transcribe_waveform_direct
-from utils.silero_vad import silero_vad
+from utils.kidwhisper import transcribe_waveform_direct, WHISPER_TIERS
+from utils.forced_alignment import align_paragraphs
+from utils.silero_vad import silero_vad, save_paragraph_audio
 from utils.voice_type_classifier import voice_type_classifier
 from utils.mispronunciation_detection.mispronunciation_detection import run_mispronunciation_detection
 from utils.load_into_paragraphs import load_into_paragraphs
-from utils.story_generation.InitialParasLinked import run_inital_paras
-from utils.story_generation.MatchLinked import run_match
-from utils.story_generation.StoryGenLinked import run_story_gen
-from utils.story_generation.NoOutlineGenLinked import run_no_outline_gen
+from utils.quantization import MODEL_VARIANT
+from utils.onnx_backend import W2V_BACKEND
+from utils.result_cache import result_cache, cache_key
+from utils.story_generation.GenerateStory import generate_story
+from utils.inference_executor import run_inference
 
 from decouple import config
 
 ROOT_PATH = config("ROOT_PATH")
+MMS_PATH = config("MMS_PATH")
+
+# Everything besides the request that changes what the pipeline returns
+MODEL_CONFIG = {
+    "whisper": WHISPER_TIERS["final"],
+    "variant": MODEL_VARIANT,
+    "w2v_backend": W2V_BACKEND,
+    "mms": MMS_PATH,
+}
 
 @api_view(["GET"])
 def TestView(request):
@@ -39,11 +50,34 @@ def ReadAttemptView(request):
 
     voice_type = request.data.get("voice_type")
     environ_type = request.data.get("environ_type")
+    scoring = request.data.get("scoring", "asr")
 
     cur_paragraph = int(request.data.get("paragraph"))
 
     paragraphs, sample_rate = load_into_paragraphs(audio_bytes, time_stamps)
 
+    cache_hash = cache_key(
+        paragraphs,
+        story=story,
+        time_stamps=time_stamps,
+        voice_type=voice_type,
+        environ_type=environ_type,
+        scoring=scoring,
+        cur_paragraph=cur_paragraph,
+        sample_rate=sample_rate,
+        models=MODEL_CONFIG
+    )
+    cached = result_cache.get(cache_hash)
+
+    if cached is not None:
+        print(f"Result cache hit {cache_hash[:12]}")
+        save_paragraph_audio(cached["speech"], sample_rate, cur_paragraph)
+        response = {
+            **cached["response"],
+            "audio": [request.build_absolute_uri(f"/media/paragraph_{i}.wav") for i in range(7)]
+        }
+        return Response(response, status=HTTP_200_OK)
+
     num_samples = 0
     for p in paragraphs:
         if p == "empty": continue
@@ -52,11 +86,14 @@ def ReadAttemptView(request):
     duration = num_samples / sample_rate
 
     sv_start = time.time()
-    empty = silero_vad(paragraphs, sample_rate, cur_paragraph)
+    speech, empty, segments = silero_vad(paragraphs, sample_rate)
     sv_end = time.time()
 
+    # The only disk write: the speech-only audio served back to the client
+    save_paragraph_audio(speech[0], sample_rate, cur_paragraph)
+
     vtc_start = time.time()
-    paragraphs = voice_type_classifier(empty, voice_type, cur_paragraph)
+    paragraphs = voice_type_classifier(speech, empty, voice_type, cur_paragraph, sample_rate, segments)
     vtc_end = time.time()
 
     num_samples = 0
@@ -67,9 +104,14 @@ def ReadAttemptView(request):
     spoken_duration = num_samples / sample_rate
 
     t_start = time.time()
-    transcripts = transcribe_waveform_direct(paragraphs, sample_rate, environ_type)
+    if scoring == "alignment":
+        # The story is known, so align it against the audio instead of decoding freely
+        results, accuracy, transcripts, word_timings = align_paragraphs(story, paragraphs, sample_rate)
+    else:
+        transcripts = transcribe_waveform_direct(paragraphs, sample_rate, environ_type)
+        results, accuracy = compare_strings(story, transcripts)
+        word_timings = []
     t_end = time.time()
-    results, accuracy = compare_strings(story, transcripts)
 
     missing_words = check_missing_words(story, transcripts)
 
@@ -84,13 +126,7 @@ def ReadAttemptView(request):
     for i, missing in enumerate(missing_words):
         print(f"MP: #{i+1}")
         if missing == 0:
-            audio = paragraphs[i].numpy()
-            if audio.shape[0] > 1:
-                audio = np.mean(audio, axis=0)
-            
-            audio = audio.astype(np.float32)
-
-            mp, mistakes, new_mispronunciations = run_mispronunciation_detection(paragraphs[i], " ".join(normalize_text(story[i])), cur_paragraph)
+            mp, mistakes, new_mispronunciations = run_mispronunciation_detection(paragraphs[i], " ".join(normalize_text(story[i])), sample_rate)
             new_mis.append(new_mispronunciations)
             for key in mistakes:
                 for mpp in mistakes[key]:
@@ -126,9 +162,16 @@ def ReadAttemptView(request):
         "mistakes": total_mistakes,
         "mistakes_per_paragraph": mistakes_per_paragraph,
         "missing_words": missing_words,
-        "audio": [request.build_absolute_uri(f"/media/paragraph_{i}.wav") for i in range(7)],
+        "word_timings": word_timings,
         "new_mispronunciations": new_mis
     }
+    result_cache.put(cache_hash, {"speech": speech[0], "response": response})
+
+    # The audio URLs depend on the requesting host, so they are not cached
+    response = {
+        **response,
+        "audio": [request.build_absolute_uri(f"/media/paragraph_{i}.wav") for i in range(7)]
+    }
     
     return Response(response, status=HTTP_200_OK)
 
@@ -136,9 +179,7 @@ def ReadAttemptView(request):
 def StoryGenView(request):
     mistakes = request.data.get("mistakes")
 
-    run_inital_paras(mistakes)
-    run_match()
-    run_story_gen()
-    paragraphs = run_no_outline_gen()
+    # Same queue as GenerateStoryConsumer, so HTTP and websocket runs never overlap
+    paragraphs = async_to_sync(run_inference)("story", generate_story, mistakes)
 
     return Response(paragraphs)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import threading
+import numpy as np
+
+from decouple import config
+
+STREAM_BUFFER_SECONDS = config("STREAM_BUFFER_SECONDS", default=120, cast=int)
+
+class AudioRingBuffer:
+    """
+    Fixed capacity int16 store for the decoded audio of one streaming session.
+    Offsets are absolute sample positions since the session started. Audio
+    before the committed offset is no longer needed and may be overwritten.
+    Transcribers read it from inference threads while the consumer keeps
+    writing, so access goes through a lock.
+    """
+
+    def __init__(self, seconds=STREAM_BUFFER_SECONDS, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.capacity = seconds * sample_rate
+        self.data = np.zeros(self.capacity, dtype=np.int16)
+        self.total = 0
+        self.committed = 0
+        self.lock = threading.Lock()
+
+    @property
+    def start(self):
+        """Oldest offset that is still held in the buffer."""
+        return max(0, self.total - self.capacity)
+
+    def write(self, samples):
+        samples = (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+        with self.lock:
+            self._write(samples)
+
+    def _write(self, samples):
+        if len(samples) > self.capacity:
+            self.total += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+
+        pos = self.total % self.capacity
+        first = min(len(samples), self.capacity - pos)
+        self.data[pos:pos + first] = samples[:first]
+        self.data[:len(samples) - first] = samples[first:]
+        self.total += len(samples)
+
+        if self.total - self.committed > self.capacity:
+            print(f"Audio buffer full, dropping {self.start - self.committed} uncommitted samples")
+            self.committed = self.start
+
+    def read(self, start=None, end=None):
+        with self.lock:
+            return self._read(start, end)
+
+    def _read(self, start, end):
+        start = max(self.committed if start is None else start, self.start)
+        end = self.total if end is None else min(end, self.total)
+
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+
+        first = start % self.capacity
+        last = first + (end - start)
+
+        if last <= self.capacity:
+            samples = self.data[first:last]
+        else:
+            samples = np.concatenate((self.data[first:], self.data[:last - self.capacity]))
+
+        return samples.astype(np.float32) / 32768.0
+
+    def commit(self, offset):
+        with self.lock:
+            self.committed = min(max(self.committed, offset), self.total)
+
+    def clear(self):
+        with self.lock:
+            self.committed = self.total
@@ -2,19 +2,117 @@ from transformers import AutoProcessor, AutoModelForCTC
 import torch
 import torchaudio
 
-processor = AutoProcessor.from_pretrained("aadel4/Wav2vec_Classroom_FT")
-model = AutoModelForCTC.from_pretrained("aadel4/Wav2vec_Classroom_FT")
+from decouple import config
 
-def transcribe_with_class_w2v(waveform):
+from .onnx_backend import load_ctc_model
+from .model_registry import registry
+
+STREAM_CHUNK_SECONDS = config("CTC_STREAM_CHUNK_SECONDS", default=1.0, cast=float)
+STREAM_LEFT_SECONDS = config("CTC_STREAM_LEFT_SECONDS", default=1.0, cast=float)
+STREAM_RIGHT_SECONDS = config("CTC_STREAM_RIGHT_SECONDS", default=0.25, cast=float)
+
+# wav2vec2 emits one frame per 320 samples at 16 kHz
+FRAME_SAMPLES = 320
+
+MODEL_NAME = "aadel4/Wav2vec_Classroom_FT"
+
+registry.register(
+    "classroom-w2v",
+    lambda: load_ctc_model("classroom-w2v", lambda: AutoModelForCTC.from_pretrained(MODEL_NAME))
+)
+
+processor = None
+
+def get_processor():
+    # The processor is only a tokenizer and feature extractor, it is kept for good
+    global processor
 
+    if processor is None:
+        processor = AutoProcessor.from_pretrained(MODEL_NAME)
+    return processor
+
+def get_logits(waveform):
     if waveform.ndim > 1:
         waveform = waveform.mean(dim=0)
 
-    inputs = processor(waveform, sampling_rate=16000, return_tensors="pt", padding=True)
+    inputs = get_processor()(waveform, sampling_rate=16000, return_tensors="pt", padding=True)
+    model = registry.get("classroom-w2v")
 
     with torch.no_grad():
         logits = model(**inputs).logits
 
+    return logits
+
+def get_log_probs(waveform):
+    """Frame level CTC log posteriors, shape (frames, vocab)."""
+    return torch.log_softmax(get_logits(waveform)[0], dim=-1).numpy()
+
+def transcribe_with_class_w2v(waveform):
+    logits = get_logits(waveform)
+
     predicted_ids = torch.argmax(logits, dim=-1)
-    transcription = processor.batch_decode(predicted_ids)[0]
+    transcription = get_processor().batch_decode(predicted_ids)[0]
     return transcription
+
+
+def frames(seconds, sample_rate=16000):
+    return int(seconds * sample_rate) // FRAME_SAMPLES
+
+class StreamingCTCTranscriber:
+    """
+    Streams the classroom CTC model over fixed size chunks. Each chunk is run
+    with some left and right context and only the frames of the chunk itself
+    are kept, so greedy tokens can be stitched across chunks. Audio before
+    offset is never needed again. Same interface as StreamingTranscriber.
+    """
+
+    inference_queue = "ctc"
+
+    def __init__(self, offset=0, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.origin = offset
+        self.position = offset
+        self.chunk = frames(STREAM_CHUNK_SECONDS, sample_rate) * FRAME_SAMPLES
+        self.left = frames(STREAM_LEFT_SECONDS, sample_rate) * FRAME_SAMPLES
+        self.right = frames(STREAM_RIGHT_SECONDS, sample_rate) * FRAME_SAMPLES
+        self.tokens = []
+        self.last_token = None
+
+    @property
+    def offset(self):
+        return max(self.origin, self.position - self.left)
+
+    def _greedy(self, buffer, start, stop, right):
+        # Step the window start back in whole frames so frame boundaries line up
+        context = min(self.left, start - max(self.origin, buffer.start))
+        context -= context % FRAME_SAMPLES
+        audio = buffer.read(start - context, stop + right)
+
+        logits = get_logits(torch.from_numpy(audio))[0]
+        first = context // FRAME_SAMPLES
+        return logits[first:first + (stop - start) // FRAME_SAMPLES].argmax(dim=-1).tolist()
+
+    def _collapse(self, ids, tokens, last_token, blank):
+        for token in ids:
+            if token != last_token and token != blank:
+                tokens.append(token)
+            last_token = token
+        return last_token
+
+    def update(self, buffer, end=None):
+        end = buffer.total if end is None else min(end, buffer.total)
+        # Fetched here, on the ctc queue, as the first call may have to load it
+        tokenizer = get_processor().tokenizer
+
+        while self.position + self.chunk + self.right <= end:
+            ids = self._greedy(buffer, self.position, self.position + self.chunk, self.right)
+            self.last_token = self._collapse(ids, self.tokens, self.last_token, tokenizer.pad_token_id)
+            self.position += self.chunk
+
+        # Whatever is left is decoded without right context as a tentative tail
+        tail = []
+        if end - self.position >= FRAME_SAMPLES:
+            ids = self._greedy(buffer, self.position, end, 0)
+            self._collapse(ids, tail, self.last_token, tokenizer.pad_token_id)
+
+        return tokenizer.decode(self.tokens + tail, group_tokens=False).strip()
@@ -1,14 +1,385 @@
-import io
+import os
+import struct
+import threading
+import warnings
+import av
 import ffmpeg
-import torchaudio
+import numpy as np
+import torch
 
-def convert_webm_to_wav(audio_bytes, sample_rate=16000):
+from av.error import FFmpegError
+from decouple import config
+
+STREAM_DECODER = config("STREAM_DECODER", default="native")
+
+# Header of a raw PCM websocket frame: sequence number, sample count (uint32 LE)
+PCM_FRAME_HEADER = struct.Struct("<II")
+# Longest run of missing PCM frames that is filled with silence
+PCM_MAX_GAP_SECONDS = config("PCM_MAX_GAP_SECONDS", default=5.0, cast=float)
+
+# EBML / Matroska element ids used by MediaRecorder WebM output
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+CLUSTER = 0x1F43B675
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_NUMBER = 0xD7
+CODEC_ID = 0x86
+CODEC_PRIVATE = 0x63A2
+BLOCK_GROUP = 0xA0
+BLOCK = 0xA1
+SIMPLE_BLOCK = 0xA3
+
+# Master elements we step into instead of buffering them whole. Segment and
+# Cluster are written with an unknown size by MediaRecorder, so they have to
+# be walked as the bytes arrive.
+STREAMED_MASTERS = {SEGMENT, CLUSTER, BLOCK_GROUP}
+
+# After a malformed element, bytes are skipped until one of these ids. Any
+# other id found there is most likely payload, and its size would have us
+# wait for, or swallow, the blocks that follow.
+RESYNC_IDS = STREAMED_MASTERS | {EBML_HEADER, TRACKS, BLOCK, SIMPLE_BLOCK}
+
+# A MediaRecorder element other than the streamed masters is at most a few
+# kB; anything claiming more than this is a corrupt size and is skipped
+WEBM_MAX_ELEMENT_BYTES = 4 * 2**20
+WEBM_MAX_BUFFER_BYTES = 16 * 2**20
+
+PCM_DTYPES = {
+    "f32le": torch.float32,
+    "s16le": torch.int16,
+}
+
+class DecodeError(Exception):
+    pass
+
+def pcm_to_tensor(pcm, sample_format="f32le"):
+    """
+    Wraps raw little-endian PCM bytes in a (1, num_samples) tensor without copying.
+    """
+    if len(pcm) == 0:
+        return torch.zeros((1, 0), dtype=PCM_DTYPES[sample_format])
+
+    # ffmpeg hands back immutable bytes; the tensor is only ever read from
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.frombuffer(pcm, dtype=PCM_DTYPES[sample_format]).unsqueeze(0)
+
+def convert_webm_to_pcm(audio_bytes, sample_rate=16000, sample_format="f32le"):
     out, err = (
         ffmpeg
         .input('pipe:0', format='webm')
-        .output('pipe:1', format='wav', ac=1, ar=sample_rate)
+        .output('pipe:1', format=sample_format, acodec=f'pcm_{sample_format}', ac=1, ar=sample_rate)
         .run(input=audio_bytes, capture_stdout=True, capture_stderr=True)
     )
 
-    waveform, sr = torchaudio.load(io.BytesIO(out))
-    return waveform, sr
\ No newline at end of file
+    return pcm_to_tensor(out, sample_format), sample_rate
+
+def read_vint(data, pos, keep_marker=False):
+    """
+    Reads an EBML variable length integer at pos.
+    Returns (value, length), or None if data does not hold the whole integer yet.
+    """
+    if pos >= len(data):
+        return None
+
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+
+    if length > 8:
+        raise DecodeError("Invalid EBML variable length integer")
+    if pos + length > len(data):
+        return None
+
+    value = first if keep_marker else first & (mask - 1)
+    unknown = value == mask - 1
+
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+        unknown = unknown and byte == 0xFF
+
+    if unknown and not keep_marker:
+        value = None
+
+    return value, length
+
+def iter_elements(data):
+    pos = 0
+    while pos < len(data):
+        element_id, id_len = read_vint(data, pos, keep_marker=True)
+        size, size_len = read_vint(data, pos + id_len)
+        start = pos + id_len + size_len
+        yield element_id, data[start:start + size]
+        pos = start + size
+
+class WebmDemuxer:
+    """
+    Incremental WebM demuxer. Bytes can be fed in arbitrary pieces; complete
+    Opus packets of the audio track are returned as soon as they are available.
+    Malformed elements are skipped, so one bad element does not stall the
+    stream; DecodeError is only raised when a feed yields nothing else.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.resyncing = False
+        self.track = None
+        self.codec_id = None
+        self.codec_private = None
+
+    def feed(self, data):
+        self.buffer.extend(data)
+
+        if len(self.buffer) > WEBM_MAX_BUFFER_BYTES:
+            self.buffer.clear()
+            raise DecodeError(f"WebM buffer grew past {WEBM_MAX_BUFFER_BYTES} bytes without a complete element")
+
+        packets = []
+        errors = []
+        pos = 0
+
+        while True:
+            try:
+                element_id = read_vint(self.buffer, pos, keep_marker=True)
+                size = read_vint(self.buffer, pos + element_id[1]) if element_id is not None else None
+            except DecodeError as e:
+                # Not an element header, drop a byte and try again from the next one
+                errors.append(str(e))
+                self.resyncing = True
+                pos += 1
+                continue
+
+            if element_id is None or size is None:
+                break
+            element_id, id_len = element_id
+            size, size_len = size
+
+            if self.resyncing and element_id not in RESYNC_IDS:
+                pos += 1
+                continue
+            self.resyncing = False
+
+            if element_id in STREAMED_MASTERS:
+                pos += id_len + size_len
+                continue
+
+            if size is None:
+                # Its end cannot be known, step over the header and resync on what follows
+                errors.append(f"Unknown sized element 0x{element_id:X}")
+                self.resyncing = True
+                pos += id_len + size_len
+                continue
+
+            if size > WEBM_MAX_ELEMENT_BYTES:
+                errors.append(f"Element 0x{element_id:X} claims {size} bytes")
+                self.resyncing = True
+                pos += 1
+                continue
+
+            end = pos + id_len + size_len + size
+            if end > len(self.buffer):
+                break
+
+            payload = bytes(self.buffer[pos + id_len + size_len:end])
+            pos = end
+
+            try:
+                if element_id == TRACKS:
+                    self._read_tracks(payload)
+                elif element_id in (SIMPLE_BLOCK, BLOCK):
+                    packet = self._read_block(payload)
+                    if packet is not None:
+                        packets.append(packet)
+            except (DecodeError, IndexError, KeyError, TypeError) as e:
+                errors.append(str(e) or f"Malformed element 0x{element_id:X}")
+
+        del self.buffer[:pos]
+
+        if errors and not packets:
+            raise DecodeError("; ".join(errors))
+        for error in errors:
+            print(f"WebM: skipped element ({error})")
+
+        return packets
+
+    def _read_tracks(self, payload):
+        for element_id, entry in iter_elements(payload):
+            if element_id != TRACK_ENTRY:
+                continue
+
+            fields = dict(iter_elements(entry))
+            codec_id = fields.get(CODEC_ID, b"").decode("ascii", errors="ignore").rstrip("\x00")
+
+            if codec_id.startswith("A_"):
+                self.track = int.from_bytes(fields[TRACK_NUMBER], "big")
+                self.codec_id = codec_id
+                self.codec_private = fields.get(CODEC_PRIVATE)
+                return
+
+    def _read_block(self, payload):
+        track, track_len = read_vint(payload, 0)
+
+        if self.track is not None and track != self.track:
+            return None
+
+        flags = payload[track_len + 2]
+        if (flags >> 1) & 0x03:
+            raise DecodeError("Laced WebM blocks are not supported")
+
+        return payload[track_len + 3:]
+
+class WebmStreamDecoder:
+    """
+    Keeps the container and codec state of one WebM/Opus stream so that each
+    call only decodes the newly arrived bytes. Returns mono float32 samples.
+    """
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.demuxer = WebmDemuxer()
+        self.codec = None
+        self.resampler = av.AudioResampler(format="flt", layout="mono", rate=sample_rate)
+
+    def _open_codec(self):
+        if self.demuxer.codec_id != "A_OPUS":
+            raise DecodeError(f"Unsupported WebM audio codec: {self.demuxer.codec_id}")
+
+        self.codec = av.CodecContext.create("opus", "r")
+        if self.demuxer.codec_private:
+            self.codec.extradata = self.demuxer.codec_private
+
+    def decode(self, data):
+        try:
+            packets = self.demuxer.feed(data)
+            samples = []
+
+            for packet in packets:
+                if self.codec is None:
+                    self._open_codec()
+
+                for frame in self.codec.decode(av.Packet(packet)):
+                    for resampled in self.resampler.resample(frame):
+                        samples.append(resampled.to_ndarray()[0])
+        except FFmpegError as e:
+            raise DecodeError(str(e)) from e
+
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        return np.concatenate(samples)
+
+    def close(self):
+        self.codec = None
+        self.demuxer = WebmDemuxer()
+
+class FFmpegStreamDecoder:
+    """
+    Fallback stream decoder backed by one long-lived ffmpeg process. WebM bytes
+    are written to its stdin and raw float32 PCM is collected from stdout by a
+    reader thread, so decode() never blocks waiting for ffmpeg output.
+    """
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.pcm = bytearray()
+        self.lock = threading.Lock()
+
+        self.process = (
+            ffmpeg
+            .input('pipe:0', format='webm', fflags='nobuffer', probesize=32, analyzeduration=0)
+            .output('pipe:1', format='f32le', acodec='pcm_f32le', ac=1, ar=sample_rate, flush_packets=1)
+            .global_args('-loglevel', 'error')
+            .run_async(pipe_stdin=True, pipe_stdout=True)
+        )
+
+        self.reader = threading.Thread(target=self._read_stdout, daemon=True)
+        self.reader.start()
+
+    def _read_stdout(self):
+        fd = self.process.stdout.fileno()
+        while True:
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            with self.lock:
+                self.pcm.extend(data)
+
+    def decode(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError) as e:
+            raise DecodeError(f"ffmpeg exited with code {self.process.poll()}") from e
+
+        with self.lock:
+            usable = len(self.pcm) - len(self.pcm) % 4
+            out = bytes(self.pcm[:usable])
+            del self.pcm[:usable]
+
+        return np.frombuffer(out, dtype=np.float32)
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+        self.reader.join(timeout=1)
+
+class PcmFrameDecoder:
+    """
+    Decoder for clients that stream framed 16-bit PCM instead of WebM. Each
+    frame is a PCM_FRAME_HEADER followed by little-endian int16 mono samples
+    at the session sample rate, so no container decoding is needed. Missing
+    frames are filled with silence of the previous frame's length so later
+    audio keeps its place on the session timeline.
+    """
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.sequence = None
+        self.frame_samples = 0
+
+    def decode(self, data):
+        if len(data) < PCM_FRAME_HEADER.size:
+            raise DecodeError("PCM frame is shorter than its header")
+
+        sequence, num_samples = PCM_FRAME_HEADER.unpack_from(data)
+        payload = memoryview(data)[PCM_FRAME_HEADER.size:]
+
+        if len(payload) != num_samples * 2:
+            raise DecodeError(f"PCM frame {sequence} declares {num_samples} samples but carries {len(payload) // 2}")
+
+        gap = 0
+        if self.sequence is not None:
+            if sequence <= self.sequence:
+                print(f"Dropping duplicate PCM frame {sequence}")
+                return np.zeros(0, dtype=np.float32)
+            if sequence != self.sequence + 1:
+                print(f"PCM frames {self.sequence + 1}-{sequence - 1} missing, filling with silence")
+                # A corrupt sequence number must not allocate hours of silence
+                gap = min((sequence - self.sequence - 1) * self.frame_samples, int(PCM_MAX_GAP_SECONDS * self.sample_rate))
+
+        samples = np.zeros(gap + num_samples, dtype=np.float32)
+        samples[gap:] = np.frombuffer(payload, dtype="<i2") / 32768.0
+
+        self.sequence = sequence
+        self.frame_samples = num_samples
+        return samples
+
+    def close(self):
+        self.sequence = None
+        self.frame_samples = 0
+
+def create_stream_decoder(stream_format="webm", sample_rate=16000, backend=STREAM_DECODER):
+    if stream_format == "pcm16":
+        return PcmFrameDecoder(sample_rate)
+    if backend == "ffmpeg":
+        return FFmpegStreamDecoder(sample_rate)
+    return WebmStreamDecoder(sample_rate)
@@ -0,0 +1,219 @@
+import numpy as np
+import torchaudio
+
+from decouple import config
+
+from .compare import normalize_text
+from .classroom_wav2vec import get_log_probs, get_processor
+
+# Log probability cost of skipping a story word entirely
+ALIGN_DELETION_PENALTY = config("ALIGN_DELETION_PENALTY", default=8.0, cast=float)
+# Per frame cost of explaining a non-blank frame between words as extra speech
+ALIGN_INSERTION_PENALTY = config("ALIGN_INSERTION_PENALTY", default=2.0, cast=float)
+# Posterior below which a character of a word, and so the word, counts as misread
+ALIGN_MIN_CONFIDENCE = config("ALIGN_MIN_CONFIDENCE", default=0.4, cast=float)
+
+FRAME_SECONDS = 0.02
+
+GARBAGE = 0
+CHAR = 1
+BLANK = 2
+
+def word_tokens(word, vocab):
+    tokens = []
+    for ch in word:
+        for candidate in (ch, ch.upper(), ch.lower()):
+            if candidate in vocab:
+                tokens.append(vocab[candidate])
+                break
+    return tokens
+
+class AlignmentGraph:
+    """
+    Left to right graph over the story: G0 W1 G1 W2 ... WN GN. Each Wk is the
+    usual CTC topology for the characters of word k, each Gk a garbage state
+    that absorbs silence, word delimiters and inserted speech. Gk-1 -> Gk
+    skips word k (a deletion).
+    """
+
+    def __init__(self, words, vocab, blank):
+        self.kind = [GARBAGE]
+        self.token = [-1]
+        self.word = [-1]
+        self.garbage = [0]
+        self.last_char = {}
+
+        for k, word in enumerate(words):
+            tokens = word_tokens(word, vocab)
+
+            for i, token in enumerate(tokens):
+                if i > 0:
+                    self._add(BLANK, blank, k)
+                self._add(CHAR, token, k)
+
+            if tokens:
+                self.last_char[k] = len(self.kind) - 1
+
+            self._add(GARBAGE, -1, -1)
+            self.garbage.append(len(self.kind) - 1)
+
+        self.kind = np.array(self.kind)
+        self.token = np.array(self.token)
+        self.word = np.array(self.word)
+
+        # Incoming edges in four slots: self loop, previous state, skip over
+        # an intra-word blank, skip over a whole word. -1 marks no edge.
+        size = len(self.kind)
+        states = np.arange(size)
+        self.pred = np.full((4, size), -1)
+        self.penalty = np.zeros((4, size))
+
+        self.pred[0] = states
+        self.pred[1, 1:] = states[:-1]
+
+        for s in range(2, size):
+            if self.kind[s] == CHAR and self.kind[s - 1] == BLANK and self.token[s - 2] != self.token[s]:
+                self.pred[2, s] = s - 2
+
+        for k in range(1, len(self.garbage)):
+            self.pred[3, self.garbage[k]] = self.garbage[k - 1]
+            self.penalty[3, self.garbage[k]] = -ALIGN_DELETION_PENALTY
+
+    def _add(self, kind, token, word):
+        self.kind.append(kind)
+        self.token.append(token)
+        self.word.append(word)
+
+def viterbi(graph, log_probs, blank, delimiter):
+    frames = len(log_probs)
+    size = len(graph.kind)
+
+    emit = log_probs[:, np.maximum(graph.token, 0)]
+
+    # Garbage frames are silence, a word delimiter, or (penalised) any other token
+    other = log_probs.copy()
+    other[:, blank] = -np.inf
+    if delimiter is not None:
+        other[:, delimiter] = -np.inf
+    filler = other.max(axis=1) - ALIGN_INSERTION_PENALTY
+
+    silence = log_probs[:, blank]
+    if delimiter is not None:
+        silence = np.maximum(silence, log_probs[:, delimiter])
+
+    garbage = graph.kind == GARBAGE
+    emit[:, garbage] = np.maximum(silence, filler)[:, None]
+    inserted = filler > silence
+
+    pred = np.where(graph.pred < 0, size, graph.pred)
+    back = np.zeros((frames, size), dtype=np.int8)
+    delta = np.full(size, -np.inf)
+    delta[0] = 0.0
+    states = np.arange(size)
+
+    for t in range(frames):
+        extended = np.append(delta, -np.inf)
+        candidates = extended[pred] + graph.penalty
+        best = candidates.argmax(axis=0)
+        back[t] = best
+        delta = candidates[best, states] + emit[t]
+
+    ends = [graph.garbage[-1]]
+    if len(graph.garbage) - 2 in graph.last_char:
+        ends.append(graph.last_char[len(graph.garbage) - 2])
+    state = max(ends, key=lambda s: delta[s])
+
+    path = np.zeros(frames, dtype=int)
+    for t in range(frames - 1, -1, -1):
+        path[t] = state
+        state = graph.pred[back[t, state], state]
+
+    return path, inserted
+
+def greedy_text(log_probs):
+    if len(log_probs) == 0:
+        return ""
+    return get_processor().decode(log_probs.argmax(axis=1)).strip().lower()
+
+def insertions(path, inserted, state, log_probs):
+    frames = np.nonzero((path == state) & inserted)[0]
+    if len(frames) == 0:
+        return []
+    return [(None, h, "insertion") for h in greedy_text(log_probs[frames[0]:frames[-1] + 1]).split()]
+
+def align_words(words, log_probs):
+    """
+    Force-aligns the story words against CTC log posteriors. Returns the
+    alignment in the compare_strings format and per word timings in seconds.
+    """
+    tokenizer = get_processor().tokenizer
+    vocab = tokenizer.get_vocab()
+    blank = tokenizer.pad_token_id
+    delimiter = vocab.get(getattr(tokenizer, "word_delimiter_token", "|"))
+
+    graph = AlignmentGraph(words, vocab, blank)
+    path, inserted = viterbi(graph, log_probs, blank, delimiter)
+
+    alignment = insertions(path, inserted, graph.garbage[0], log_probs)
+    timings = []
+
+    for k, word in enumerate(words):
+        frames = np.nonzero(graph.word[path] == k)[0]
+
+        if len(frames) == 0:
+            alignment.append((word, None, "deletion"))
+        else:
+            # A word is only as good as its least certain character
+            chars = frames[graph.kind[path[frames]] == CHAR]
+            posteriors = np.exp(log_probs[chars, graph.token[path[chars]]])
+            confidence = min(posteriors[path[chars] == s].max() for s in np.unique(path[chars]))
+
+            start, end = int(frames[0]), int(frames[-1]) + 1
+            timings.append({"word": word, "start": start * FRAME_SECONDS, "end": end * FRAME_SECONDS})
+
+            if confidence >= ALIGN_MIN_CONFIDENCE:
+                alignment.append((word, word, "correct"))
+            else:
+                alignment.append((word, greedy_text(log_probs[start:end]) or None, "substitution"))
+
+        # Speech absorbed by the garbage state after this word
+        alignment += insertions(path, inserted, graph.garbage[k + 1], log_probs)
+
+    return alignment, timings
+
+def align_paragraphs(story, paragraphs, sample_rate):
+    """
+    Scores each paragraph by forced alignment against its story text instead
+    of free ASR. Returns (results, accuracy, transcripts, timings).
+    """
+    results = []
+    transcripts = []
+    timings = []
+
+    correct_words = 0
+    total_words = 0
+
+    for i, waveform in enumerate(paragraphs):
+        print(f"Alignment: Paragraph #{i+1}")
+
+        if waveform == "empty":
+            results.append([])
+            transcripts.append("empty")
+            timings.append([])
+            continue
+
+        if sample_rate != 16000:
+            waveform = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)(waveform)
+
+        words = normalize_text(story[i])
+        alignment, word_timings = align_words(words, get_log_probs(waveform))
+
+        correct_words += sum(1 for _, _, label in alignment if label == "correct")
+        total_words += len(words)
+
+        results.append(alignment)
+        transcripts.append(" ".join(h for _, h, _ in alignment if h is not None))
+        timings.append(word_timings)
+
+    accuracy = correct_words / total_words if total_words > 0 else 0
+    return results, accuracy, transcripts, timings
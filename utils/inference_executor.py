@@ -0,0 +1,31 @@
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+
+# Worker threads per queue. Work for one model is kept on its own queue so a
+# long job on one model never holds up requests for another; the models
+# themselves release the GIL while they compute.
+QUEUE_WORKERS = {
+    "decode": config("INFERENCE_DECODE_WORKERS", default=2, cast=int),
+    "vad": config("INFERENCE_VAD_WORKERS", default=1, cast=int),
+    "whisper": config("INFERENCE_WHISPER_WORKERS", default=1, cast=int),
+    "ctc": config("INFERENCE_CTC_WORKERS", default=1, cast=int),
+    # The story pipeline reads and writes fixed files under SG_PATH, so two
+    # runs at once would mix up each other's stories
+    "story": config("INFERENCE_STORY_WORKERS", default=1, cast=int),
+}
+
+executors = {
+    name: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"inference-{name}")
+    for name, workers in QUEUE_WORKERS.items()
+}
+
+async def run_inference(queue, fn, *args, **kwargs):
+    """
+    Runs the blocking fn on the given queue's threads and waits for it
+    without blocking the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executors[queue], functools.partial(fn, *args, **kwargs))
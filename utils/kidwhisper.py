@@ -1,24 +1,50 @@
 import os
+import threading
 import certifi
 import whisper
 import numpy
 import torchaudio
 
+from concurrent.futures import Future
+from decouple import config
+
 from .classroom_wav2vec import transcribe_with_class_w2v
+from .whisper_batching import WhisperBatcher, decode_options
+from .quantization import load_model_variant
+from .model_registry import registry
 
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
-model = None
+device = config("device")
+
+# The draft tier serves the live partials of the streaming consumer, the final
+# tier the score that gets recorded
+WHISPER_TIERS = {
+    "draft": config("WHISPER_DRAFT_MODEL", default="tiny"),
+    "final": config("WHISPER_FINAL_MODEL", default="small"),
+}
+
+def register_whisper(size):
+    name = f"whisper-{size}"
+    registry.register(name, lambda: load_model_variant(name, lambda: whisper.load_model(size, device=device), device))
 
-def load_model():
-    global model
+for size in set(WHISPER_TIERS.values()):
+    register_whisper(size)
 
-    if model is None:
-        model = whisper.load_model("small")
-    return model
+# Whisper installs kv-cache hooks on the model for every decode, so only one
+# thread may run a model at a time. Tiers using the same model share a lock.
+size_locks = {size: threading.Lock() for size in set(WHISPER_TIERS.values())}
+model_locks = {tier: size_locks[size] for tier, size in WHISPER_TIERS.items()}
+
+def load_model(tier="final"):
+    return registry.get(f"whisper-{WHISPER_TIERS[tier]}")
+
+batcher = WhisperBatcher(load_model, lock=model_locks["final"])
 
 def transcribe_with_whisper(wav_path: str) -> str:
-    result = model.transcribe(wav_path)
+    with model_locks["final"]:
+        model = load_model()
+        result = model.transcribe(wav_path, **decode_options(model))
     return result['text']
 
 def transcribe_waveform_direct(paragraphs, sample_rate, environ_type):
@@ -37,12 +63,25 @@ def transcribe_waveform_direct(paragraphs, sample_rate, environ_type):
         if environ_type == "Noisy":
             transcripts.append(transcribe_with_class_w2v(waveform))
         else:
-            audio = waveform.squeeze().numpy().astype("float32")
+            audio = waveform.squeeze().numpy().astype("float32", copy=False)
 
             if audio.max() > 1.0 or audio.min() < -1.0:
                 audio = audio / max(abs(audio.max()), abs(audio.min()))
 
-            result = model.transcribe(audio)["text"].strip().replace(",", ", ")
-            transcripts.append(result)
+            # Short paragraphs are packed and batched with other requests; longer ones need
+            # transcribe's sliding window
+            if len(audio) <= whisper.audio.N_SAMPLES:
+                transcripts.append(batcher.submit(audio))
+            else:
+                with model_locks["final"]:
+                    model = load_model()
+                    transcripts.append(model.transcribe(audio, **decode_options(model))["text"])
+
+    for i, transcript in enumerate(transcripts):
+        if isinstance(transcript, Future):
+            transcript = transcript.result()
+        if transcript != "empty" and environ_type != "Noisy":
+            transcript = transcript.strip().replace(",", ", ")
+        transcripts[i] = transcript
 
     return transcripts
\ No newline at end of file
@@ -1,7 +1,7 @@
-from .conversions import convert_webm_to_wav
+from .conversions import convert_webm_to_pcm
 
 def load_into_paragraphs(audio_bytes, time_stamps):
-    waveform, sample_rate = convert_webm_to_wav(audio_bytes)
+    waveform, sample_rate = convert_webm_to_pcm(audio_bytes)
 
     timestamps_samples = [int((t / 1000) * sample_rate) for t in time_stamps]
 
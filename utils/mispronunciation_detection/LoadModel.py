@@ -9,6 +9,8 @@ import torch
 import os
 from safetensors.torch import load_file
 
+from utils.onnx_backend import load_ctc_model
+
 class LoadModel:
     def __init__(self, model_path, device=None):
         """
@@ -23,6 +25,13 @@ class LoadModel:
     def load_model_and_processor(self):
         print(f"Loading merged model from: {self.model_path}")
         self.processor = AutoProcessor.from_pretrained(self.model_path)
+        name = f"mms-{os.path.basename(os.path.normpath(self.model_path))}"
+        self.model = load_ctc_model(name, self._build_model, str(self.device))
+        self.model.to(self.device)
+        self.model.eval()
+        print("Model and processor loaded.")
+
+    def _build_model(self):
         # Load the config to get the correct vocab_size
         config = AutoConfig.from_pretrained(self.model_path)
         correct_vocab_size = config.vocab_size
@@ -53,9 +62,7 @@ class LoadModel:
                 print("Fine-tuned lm_head loaded and applied.")
             else:
                 print(f"Warning: lm_head_state_dict.bin not found at {lm_head_path}. Using re-initialized lm_head.")
-        self.model.to(self.device)
-        self.model.eval()
-        print("Model and processor loaded.")
+        return self.model
 
     def get_model(self):
         return self.model
@@ -1,14 +1,15 @@
 import os
 import torch
 import librosa
-from phonemizer import phonemize
 from phonemizer.backend.espeak.wrapper import EspeakWrapper
 import numpy as np
-import re
 import subprocess
 
 from decouple import config
 
+from .phoneme_inventory import PHONEME_MAP, tokenize
+from .lexicon import get_phonemizer
+
 ESPEAK_PATH = config("ESPEAK_PATH")
 
 # Set eSpeak NG library path (adjust if needed)
@@ -20,26 +21,7 @@ else:
     print(f"Warning: eSpeak NG DLL not found at {ESPEAK_DLL_PATH}.")
 
 class Transcribe:
-    PHONEME_MAP = {
-        # Vowels
-        'a': 'a', 'ə': 'a', 'ʌ': 'uh', 'æ': 'a', 'ɑ': 'ah', 'e': 'e', 'ɛ': 'e',
-        'ɪ': 'i', 'i': 'ee', 'ɒ': 'o', 'ɔ': 'aw', 'ʊ': 'oo', 'u': 'oo',
-        'ɜ': 'er',
-        'aɪ': 'i', 'aʊ': 'ow', 'eɪ': 'ay', 'oʊ': 'oh', 'ɔɪ': 'oy',
-        'ɪə': 'eer', 'eə': 'air', 'ʊə': 'oor',
-        # Consonants
-        'b': 'b', 'd': 'd', 'f': 'f', 'g': 'g', 'h': 'h', 'j': 'y',
-        'k': 'k', 'l': 'l', 'm': 'm', 'n': 'n', 'p': 'p', 'r': 'r',
-        's': 's', 't': 't', 'v': 'v', 'w': 'w', 'z': 'z',
-        'θ': 'th', 'ð': 'th', 'ʃ': 'sh', 'ʒ': 'zh', 'ŋ': 'ng',
-        'tʃ': 'ch', 'dʒ': 'j', 'ʍ': 'wh',
-        'ʔ': '', 'ɾ': 'tt',
-        'd͡ʒ': 'j', 't͡ʃ': 'ch', 't͡s': 'ts', 'd͡z': 'dz',
-        # Stress/markers (ignored)
-        'ˈ': '', 'ˌ': '', '.': '', '!': '',
-        # SA approximations
-        'x': 'gh', 'r̩': 'r', 'l̩': 'l', 'm̩': 'm', 'n̩': 'n',
-    }
+    PHONEME_MAP = PHONEME_MAP
 
     def __init__(self, model, processor, device=None):
         """
@@ -51,23 +33,29 @@ class Transcribe:
         self.model.to(self.device)
         self.model.eval()
 
-    def _sorted_phonemes(self):
-        return sorted(self.PHONEME_MAP.keys(), key=len, reverse=True)
-
     def _split_phoneme_string(self, phoneme_string: str):
-        """Splits a phoneme string into a list of individual phoneme tokens."""
-        sorted_phs = self._sorted_phonemes()
-        # Create a regex pattern to match the longest phonemes first
-        pattern = '|'.join(re.escape(p) for p in sorted_phs)
-        return [m.group(0) for m in re.finditer(pattern, phoneme_string)]
+        """Splits a phoneme string into phoneme token ids (see phoneme_inventory.PHONEMES)."""
+        return tokenize(phoneme_string)
 
-    def transcribe_audio(self, audio, phonemize_gt=False, ground_truth_text=None, phonemizer_lang="en-us"):
+    def transcribe_audio(self, audio, phonemize_gt=False, ground_truth_text=None, phonemizer_lang="en-us", sample_rate=16000):
         """
-        Transcribes a single audio file. Optionally phonemizes ground truth.
+        Transcribes a single audio file path, or audio already in memory as a
+        tensor or array at sample_rate. Optionally phonemizes ground truth.
+        Phonemes are returned as token ids, one list per word.
         """
-        # Load and normalize audio
-        # sr = 16000
-        audio, sr = librosa.load(audio, sr=16000)
+        if isinstance(audio, (str, os.PathLike)):
+            audio, sr = librosa.load(audio, sr=16000)
+        else:
+            if torch.is_tensor(audio):
+                audio = audio.detach().cpu().numpy()
+            audio = np.asarray(audio, dtype=np.float32)
+
+            if audio.ndim > 1:
+                audio = audio.mean(axis=0)
+            if sample_rate != 16000:
+                audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=16000)
+
+        # Normalize audio
         audio = audio / (np.max(np.abs(audio)) + 1e-9)
 
         # Prepare input
@@ -92,11 +80,8 @@ class Transcribe:
         gt_phonemes_list_of_lists = None
         if phonemize_gt and ground_truth_text:
             gt_phonemes_list_of_lists = []
-            # Phonemize the entire ground truth text at once
-            # This returns a list of strings, where each string is the phonemes for a word
-            phonemized_words_raw = phonemize(ground_truth_text.split(), language=phonemizer_lang, backend='espeak',
-                                             strip=True, preserve_punctuation=False)
-            for phoneme_word_str in phonemized_words_raw:
-                gt_phonemes_list_of_lists.append(self._split_phoneme_string(phoneme_word_str))
+            # Story words come from the prebuilt lexicon, only unseen words go to espeak
+            for phoneme_ids in get_phonemizer(phonemizer_lang).phonemize(ground_truth_text.split()):
+                gt_phonemes_list_of_lists.append(phoneme_ids)
 
         return gt_phonemes_list_of_lists, pred_phonemes_list_of_lists
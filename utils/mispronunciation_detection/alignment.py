@@ -0,0 +1,97 @@
+import numpy as np
+
+MATCH, SUBSTITUTION, DELETION, INSERTION = range(4)
+OPERATIONS = ("match", "substitution", "deletion", "insertion")
+
+def pad(sequences, fill):
+    lengths = np.array([len(sequence) for sequence in sequences], dtype=np.int64)
+    # At least one column so indexing stays valid when every sequence is empty
+    padded = np.full((len(sequences), max(1, lengths.max(initial=0))), fill, dtype=np.int32)
+
+    for k, sequence in enumerate(sequences):
+        padded[k, :len(sequence)] = sequence
+
+    return padded, lengths
+
+def edit_distance_tables(gt, pred):
+    """
+    Levenshtein DP tables of every (gt, pred) pair at once, shape
+    (words, N + 1, M + 1). Cells on one anti-diagonal only depend on the two
+    before it, so each diagonal is filled for all words in one step.
+    """
+    words, n = gt.shape
+    m = pred.shape[1]
+
+    dp = np.empty((words, n + 1, m + 1), dtype=np.int32)
+    dp[:, :, 0] = np.arange(n + 1)
+    dp[:, 0, :] = np.arange(m + 1)
+    cost = (gt[:, :, None] != pred[:, None, :]).astype(np.int32)
+
+    for d in range(2, n + m + 1):
+        i = np.arange(max(1, d - m), min(n, d - 1) + 1)
+        j = d - i
+        dp[:, i, j] = np.minimum(
+            np.minimum(dp[:, i - 1, j], dp[:, i, j - 1]) + 1,
+            dp[:, i - 1, j - 1] + cost[:, i - 1, j - 1]
+        )
+
+    return dp
+
+def align_batch(gt_words, pred_words):
+    """
+    Aligns each ground truth word's phoneme ids with the predicted word's.
+    Returns per word a list of (operation, gt_id, pred_id) in word order, with
+    None for the side an insertion or deletion has no phoneme on. Ties are
+    broken like the original per word backtrace: match, then substitution,
+    then deletion, then insertion.
+    """
+    if len(gt_words) == 0:
+        return []
+
+    # Different fills so padding never matches
+    gt, n = pad(gt_words, -1)
+    pred, m = pad(pred_words, -2)
+    dp = edit_distance_tables(gt, pred)
+
+    rows = np.arange(len(gt_words))
+    i, j = n.copy(), m.copy()
+    steps = gt.shape[1] + pred.shape[1]
+    ops = np.full((steps, len(rows)), -1, dtype=np.int8)
+    gt_pos = np.zeros((steps, len(rows)), dtype=np.int64)
+    pred_pos = np.zeros((steps, len(rows)), dtype=np.int64)
+
+    # All words are walked back in lockstep, one operation per step
+    for step in range(steps):
+        active = (i > 0) | (j > 0)
+        if not active.any():
+            break
+
+        ip, jp = np.maximum(i - 1, 0), np.maximum(j - 1, 0)
+        here = dp[rows, i, j]
+
+        both = (i > 0) & (j > 0)
+        match = both & (gt[rows, ip] == pred[rows, jp])
+        substitution = both & ~match & (here == dp[rows, ip, jp] + 1)
+        deletion = (i > 0) & ~match & ~substitution & (here == dp[rows, ip, j] + 1)
+        insertion = (j > 0) & ~match & ~substitution & ~deletion & (here == dp[rows, i, jp] + 1)
+
+        ops[step] = np.select([match, substitution, deletion, insertion], [MATCH, SUBSTITUTION, DELETION, INSERTION], -1)
+        gt_pos[step], pred_pos[step] = ip, jp
+
+        i = i - (match | substitution | deletion)
+        j = j - (match | substitution | insertion)
+
+    alignments = []
+    for k, (gt_word, pred_word) in enumerate(zip(gt_words, pred_words)):
+        alignment = []
+        for op, g, p in zip(ops[::-1, k], gt_pos[::-1, k], pred_pos[::-1, k]):
+            if op < 0:
+                continue
+            alignment.append((
+                OPERATIONS[op],
+                gt_word[g] if op != INSERTION else None,
+                pred_word[p] if op != DELETION else None
+            ))
+        alignments.append(alignment)
+
+    return alignments
@@ -0,0 +1,64 @@
+"""
+Builds the pronunciation lexicon from the story corpora.
+
+    python -m utils.mispronunciation_detection.build_lexicon
+
+Every word of utils/story_generation/*.txt, normalized the way story text is
+before scoring, is phonemized once with espeak and stored as phoneme token ids.
+"""
+import os
+import glob
+import json
+import argparse
+import numpy as np
+
+from phonemizer.backend import EspeakBackend
+
+from utils.compare import normalize_text
+from . import Transcribe  # noqa: F401, sets the espeak library path
+from .lexicon import LEXICON_PATH
+from .phoneme_inventory import PHONEMES, tokenize
+
+CORPUS_GLOB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "story_generation", "*.txt")
+
+def corpus_vocabulary(paths):
+    words = set()
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                words.update(normalize_text(line))
+    return sorted(words)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=CORPUS_GLOB)
+    parser.add_argument("--output", default=LEXICON_PATH)
+    parser.add_argument("--language", default="en-us")
+    parser.add_argument("--njobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(args.corpus))
+    words = corpus_vocabulary(paths)
+    print(f"Phonemizing {len(words)} words from {len(paths)} files")
+
+    backend = EspeakBackend(args.language, preserve_punctuation=False)
+    phoneme_strings = backend.phonemize(words, strip=True, njobs=args.njobs)
+
+    ids = [tokenize(phoneme_string) for phoneme_string in phoneme_strings]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(word_ids) for word_ids in ids])
+    phonemes = np.fromiter((i for word_ids in ids for i in word_ids), dtype=np.uint8, count=offsets[-1])
+
+    os.makedirs(args.output, exist_ok=True)
+    np.save(os.path.join(args.output, "offsets.npy"), offsets)
+    np.save(os.path.join(args.output, "phonemes.npy"), phonemes)
+
+    with open(os.path.join(args.output, "words.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(words))
+    with open(os.path.join(args.output, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"language": args.language, "inventory": PHONEMES}, f, ensure_ascii=False)
+
+    print(f"Wrote {len(words)} words, {len(phonemes)} phonemes to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import json
+import threading
+import numpy as np
+
+from decouple import config
+from phonemizer.backend import EspeakBackend
+
+from .phoneme_inventory import PHONEMES, tokenize
+
+LEXICON_PATH = config("LEXICON_PATH", default=os.path.join(os.path.dirname(__file__), "lexicon"))
+
+class Lexicon:
+    """
+    Word -> phoneme token id lookup built offline by build_lexicon. The ids of
+    all words are stored back to back in phonemes.npy, word k owning
+    phonemes[offsets[k]:offsets[k + 1]]; both arrays are memory mapped.
+    """
+
+    def __init__(self, words, offsets, phonemes):
+        self.index = {word: k for k, word in enumerate(words)}
+        self.offsets = offsets
+        self.phonemes = phonemes
+
+    @classmethod
+    def load(cls, path=LEXICON_PATH, language="en-us"):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["language"] != language:
+            raise ValueError(f"Lexicon at {path} is for {meta['language']}, not {language}")
+        if meta["inventory"] != PHONEMES:
+            raise ValueError(f"Lexicon at {path} was built with a different phoneme inventory")
+
+        with open(os.path.join(path, "words.txt"), encoding="utf-8") as f:
+            words = f.read().split("\n")
+
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        phonemes = np.load(os.path.join(path, "phonemes.npy"), mmap_mode="r")
+        return cls(words, offsets, phonemes)
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, word):
+        k = self.index.get(word)
+        if k is None:
+            return None
+        return self.phonemes[self.offsets[k]:self.offsets[k + 1]].tolist()
+
+class Phonemizer:
+    """
+    Phonemizes words to token ids through the lexicon. Words missing from it
+    go to one espeak backend that is created on first use and kept for the
+    life of the process; their results are remembered as well.
+    """
+
+    def __init__(self, language="en-us", path=LEXICON_PATH):
+        self.language = language
+        self.backend = None
+        self.unseen = {}
+        self.lock = threading.Lock()
+
+        try:
+            self.lexicon = Lexicon.load(path, language)
+            print(f"Loaded pronunciation lexicon of {len(self.lexicon)} words")
+        except (OSError, ValueError) as e:
+            print(f"Warning: no usable pronunciation lexicon ({e}), phonemizing with espeak")
+            self.lexicon = None
+
+    def phonemize(self, words):
+        phonemes = [self.lexicon.get(word) if self.lexicon else None for word in words]
+        missing = [word for word, ids in zip(words, phonemes) if ids is None]
+
+        if missing:
+            self._phonemize_unseen(missing)
+
+        return [ids if ids is not None else self.unseen[word] for word, ids in zip(words, phonemes)]
+
+    def _phonemize_unseen(self, words):
+        with self.lock:
+            words = list(dict.fromkeys(word for word in words if word not in self.unseen))
+            if not words:
+                return
+
+            if self.backend is None:
+                self.backend = EspeakBackend(self.language, preserve_punctuation=False)
+
+            for word, phoneme_string in zip(words, self.backend.phonemize(words, strip=True)):
+                self.unseen[word] = tokenize(phoneme_string)
+
+phonemizers = {}
+
+def get_phonemizer(language="en-us"):
+    if language not in phonemizers:
+        phonemizers[language] = Phonemizer(language)
+    return phonemizers[language]
@@ -2,6 +2,9 @@ import re
 import subprocess
 from .LoadModel import LoadModel
 from .Transcribe import Transcribe
+from .phoneme_inventory import PHONEME_MAP, PHONEMES, PHONEME_LETTERS
+from .alignment import align_batch
+from utils.model_registry import registry, resident_size
 
 from decouple import config
 
@@ -10,26 +13,7 @@ MMS_PATH = config("MMS_PATH")
 device = config("device")
 
 class MispronunciationDetection:
-    PHONEME_MAP = {
-        # Vowels
-        'a': 'a', 'ə': 'a', 'ʌ': 'uh', 'æ': 'a', 'ɑ': 'ah', 'e': 'e', 'ɛ': 'e',
-        'ɪ': 'i', 'i': 'ee', 'ɒ': 'o', 'ɔ': 'aw', 'ʊ': 'oo', 'u': 'oo',
-        'ɜ': 'er',
-        'aɪ': 'i', 'aʊ': 'ow', 'eɪ': 'ay', 'oʊ': 'oh', 'ɔɪ': 'oy',
-        'ɪə': 'eer', 'eə': 'air', 'ʊə': 'oor',
-        # Consonants
-        'b': 'b', 'd': 'd', 'f': 'f', 'g': 'g', 'h': 'h', 'j': 'y',
-        'k': 'k', 'l': 'l', 'm': 'm', 'n': 'n', 'p': 'p', 'r': 'r',
-        's': 's', 't': 't', 'v': 'v', 'w': 'w', 'z': 'z',
-        'θ': 'th', 'ð': 'th', 'ʃ': 'sh', 'ʒ': 'zh', 'ŋ': 'ng',
-        'tʃ': 'ch', 'dʒ': 'j', 'ʍ': 'wh',
-        'ʔ': '', 'ɾ': 'tt',
-        'd͡ʒ': 'j', 't͡ʃ': 'ch', 't͡s': 'ts', 'd͡z': 'dz',
-        # Stress/markers (ignored)
-        'ˈ': '', 'ˌ': '', '.': '', '!': '',
-        # SA approximations
-        'x': 'gh', 'r̩': 'r', 'l̩': 'l', 'm̩': 'm', 'n̩': 'n',
-    }
+    PHONEME_MAP = PHONEME_MAP
 
     def __init__(self, model, processor, device=None):
         # Load model & processor
@@ -40,54 +24,18 @@ class MispronunciationDetection:
         self.transcriber = Transcribe(model, processor, device=device)
 
     
-    def phonemes_to_letters(self, phoneme_token: str) -> str:
-        """Map a single phoneme token to its alphabetic representation."""
-        return self.PHONEME_MAP.get(phoneme_token, '')
+    def phonemes_to_letters(self, phoneme_id) -> str:
+        """Map a single phoneme token id to its alphabetic representation."""
+        return PHONEME_LETTERS[phoneme_id] if phoneme_id is not None else ''
 
     
     def _align_phonemes(self, gt_phonemes, pred_phonemes):
         """
-        Aligns two sequences of phonemes to find substitutions, insertions, and deletions.
+        Aligns two sequences of phoneme ids to find substitutions, insertions, and deletions.
         Returns a list of tuples: (type, gt_phoneme, pred_phoneme)
         type: 'match', 'substitution', 'insertion', 'deletion'
         """
-        n = len(gt_phonemes)
-        m = len(pred_phonemes)
-
-        # Initialize DP table
-        dp = [[0] * (m + 1) for _ in range(n + 1)]
-        for i in range(n + 1):
-            dp[i][0] = i
-        for j in range(m + 1):
-            dp[0][j] = j
-
-        # Fill DP table
-        for i in range(1, n + 1):
-            for j in range(1, m + 1):
-                cost = 0 if gt_phonemes[i - 1] == pred_phonemes[j - 1] else 1
-                dp[i][j] = min(dp[i - 1][j] + 1,       # Deletion
-                               dp[i][j - 1] + 1,       # Insertion
-                               dp[i - 1][j - 1] + cost) # Substitution/Match
-
-        # Backtrack to find alignment
-        alignment = []
-        i, j = n, m
-        while i > 0 or j > 0:
-            if i > 0 and j > 0 and gt_phonemes[i - 1] == pred_phonemes[j - 1]:
-                alignment.append(('match', gt_phonemes[i - 1], pred_phonemes[j - 1]))
-                i -= 1
-                j -= 1
-            elif i > 0 and j > 0 and dp[i][j] == dp[i - 1][j - 1] + 1:
-                alignment.append(('substitution', gt_phonemes[i - 1], pred_phonemes[j - 1]))
-                i -= 1
-                j -= 1
-            elif i > 0 and dp[i][j] == dp[i - 1][j] + 1:
-                alignment.append(('deletion', gt_phonemes[i - 1], None))
-                i -= 1
-            elif j > 0 and dp[i][j] == dp[i][j - 1] + 1:
-                alignment.append(('insertion', None, pred_phonemes[j - 1]))
-                j -= 1
-        return alignment[::-1] # Reverse to get correct order
+        return align_batch([gt_phonemes], [pred_phonemes])[0]
 
     def find_mispronunciations(self, ground_truth, predicted, original_text):
         original_text_list = original_text.split()
@@ -102,6 +50,9 @@ class MispronunciationDetection:
         if len(ground_truth) > len(predicted):
             return [{"message": "error"}], {}, []
 
+        # Every word of the paragraph is aligned in one batched pass
+        alignments = align_batch(ground_truth, predicted[:len(ground_truth)])
+
         for i in range(len(ground_truth)):
             ground_truth_word_phonemes = ground_truth[i]
             predicted_word_phonemes = predicted[i]
@@ -109,7 +60,7 @@ class MispronunciationDetection:
             
             word_mispronounced = False
             
-            alignment = self._align_phonemes(ground_truth_word_phonemes, predicted_word_phonemes)
+            alignment = alignments[i]
 
             new_mispronunciations.append(("", ""))
 
@@ -117,7 +68,7 @@ class MispronunciationDetection:
 
                 if item_type == 'substitution':
                     word_mispronounced = True
-                    mispronunciation_espeak_dict[gt_ph] = mispronunciation_espeak_dict.get(gt_ph, 0) + 1
+                    mispronunciation_espeak_dict[PHONEMES[gt_ph]] = mispronunciation_espeak_dict.get(PHONEMES[gt_ph], 0) + 1
                     alph_letter = self.phonemes_to_letters(gt_ph)
                     user_misp_output_str = f'You pronounced the "{alph_letter}" sound in "{original_word}" incorrectly (expected "{self.phonemes_to_letters(gt_ph)}", got "{self.phonemes_to_letters(pred_ph)}").\n'
                     
@@ -139,7 +90,7 @@ class MispronunciationDetection:
 
                 elif item_type == 'deletion':
                     word_mispronounced = True
-                    mispronunciation_espeak_dict[gt_ph] = mispronunciation_espeak_dict.get(gt_ph, 0) + 1
+                    mispronunciation_espeak_dict[PHONEMES[gt_ph]] = mispronunciation_espeak_dict.get(PHONEMES[gt_ph], 0) + 1
                     alph_letter = self.phonemes_to_letters(gt_ph)
                     user_misp_output_str = f'You missed the "{alph_letter}" sound in "{original_word}".\n'
 
@@ -197,11 +148,12 @@ class MispronunciationDetection:
 
         # return mispronunciation_espeak_dict, mispronunciation_alph_dict, user_output, user_misp_output_str
 
-    def run(self, audio, ground_truth_text):
+    def run(self, audio, ground_truth_text, sample_rate=16000):
         gt_phonemes, pred_phonemes = self.transcriber.transcribe_audio(
             audio,
             phonemize_gt=True,
-            ground_truth_text=ground_truth_text
+            ground_truth_text=ground_truth_text,
+            sample_rate=sample_rate
         )
 
         # print("Ground Truth (Phonemes):", gt_phonemes)
@@ -217,28 +169,21 @@ class MispronunciationDetection:
         # print("Mispronunciation Espeak dictionary:", mispronunciation_espeak_dict)
         # print("Mispronunciation Alphabet dictionary:", mispronunciation_alph_dict)
 
-loader = None
-model = None
-processor = None
-detector = None
+def load_detector():
+    loader = LoadModel(MMS_PATH, device=device)
+    loader.load_model_and_processor()
+    return MispronunciationDetection(loader.get_model(), loader.get_processor())
+
+registry.register("mms", load_detector, lambda detector: resident_size(detector.transcriber.model))
 
 def load_md_model():
-    global loader
-    global model
-    global processor
-    global detector
-
-    if detector is None:
-        loader = LoadModel(MMS_PATH, device=device)
-        loader.load_model_and_processor()
-        model = loader.get_model()
-        processor = loader.get_processor()
-        detector = MispronunciationDetection(model, processor)
-
-def run_mispronunciation_detection(audio, ground_truth, i):
-    mispronunciations, mispronunciation_alph_dict, new_mispronunciations = detector.run(
-        f"{ROOT_PATH}/media/paragraph_{i}.wav",
-        ground_truth
+    return registry.get("mms")
+
+def run_mispronunciation_detection(audio, ground_truth, sample_rate=16000):
+    mispronunciations, mispronunciation_alph_dict, new_mispronunciations = load_md_model().run(
+        audio,
+        ground_truth,
+        sample_rate
     )
 
     return mispronunciations, mispronunciation_alph_dict, new_mispronunciations
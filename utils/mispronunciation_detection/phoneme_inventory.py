@@ -0,0 +1,66 @@
+# Phoneme tokens the espeak and MMS output is split into, with the letters
+# they are shown to the user as
+PHONEME_MAP = {
+    # Vowels
+    'a': 'a', 'ə': 'a', 'ʌ': 'uh', 'æ': 'a', 'ɑ': 'ah', 'e': 'e', 'ɛ': 'e',
+    'ɪ': 'i', 'i': 'ee', 'ɒ': 'o', 'ɔ': 'aw', 'ʊ': 'oo', 'u': 'oo',
+    'ɜ': 'er',
+    'aɪ': 'i', 'aʊ': 'ow', 'eɪ': 'ay', 'oʊ': 'oh', 'ɔɪ': 'oy',
+    'ɪə': 'eer', 'eə': 'air', 'ʊə': 'oor',
+    # Consonants
+    'b': 'b', 'd': 'd', 'f': 'f', 'g': 'g', 'h': 'h', 'j': 'y',
+    'k': 'k', 'l': 'l', 'm': 'm', 'n': 'n', 'p': 'p', 'r': 'r',
+    's': 's', 't': 't', 'v': 'v', 'w': 'w', 'z': 'z',
+    'θ': 'th', 'ð': 'th', 'ʃ': 'sh', 'ʒ': 'zh', 'ŋ': 'ng',
+    'tʃ': 'ch', 'dʒ': 'j', 'ʍ': 'wh',
+    'ʔ': '', 'ɾ': 'tt',
+    'd͡ʒ': 'j', 't͡ʃ': 'ch', 't͡s': 'ts', 'd͡z': 'dz',
+    # Stress/markers (ignored)
+    'ˈ': '', 'ˌ': '', '.': '', '!': '',
+    # SA approximations
+    'x': 'gh', 'r̩': 'r', 'l̩': 'l', 'm̩': 'm', 'n̩': 'n',
+}
+
+# Token ids are positions in this list, so it may only ever be appended to
+PHONEMES = list(PHONEME_MAP)
+PHONEME_IDS = {phoneme: i for i, phoneme in enumerate(PHONEMES)}
+
+PHONEME_LETTERS = [PHONEME_MAP[phoneme] for phoneme in PHONEMES]
+
+def build_trie(phonemes):
+    trie = {}
+    for i, phoneme in enumerate(phonemes):
+        node = trie
+        for char in phoneme:
+            node = node.setdefault(char, {})
+        node[None] = i
+    return trie
+
+PHONEME_TRIE = build_trie(PHONEMES)
+
+def tokenize(phoneme_string):
+    """
+    Splits a phoneme string into token ids, always taking the longest phoneme
+    that matches and skipping characters outside the inventory.
+    """
+    ids = []
+    pos = 0
+
+    while pos < len(phoneme_string):
+        node = PHONEME_TRIE
+        match = None
+        end = pos + 1
+
+        for k in range(pos, len(phoneme_string)):
+            node = node.get(phoneme_string[k])
+            if node is None:
+                break
+            if None in node:
+                match = node[None]
+                end = k + 1
+
+        if match is not None:
+            ids.append(match)
+        pos = end
+
+    return ids
@@ -0,0 +1,86 @@
+import gc
+import threading
+import torch
+
+from collections import OrderedDict
+from decouple import config
+
+# 0 disables eviction
+MODEL_MEMORY_BUDGET_MB = config("MODEL_MEMORY_BUDGET_MB", default=0, cast=int)
+
+def resident_size(obj):
+    """Approximate bytes held by a loaded model."""
+    if hasattr(obj, "resident_size"):
+        return obj.resident_size()
+
+    if isinstance(obj, (tuple, list)):
+        return sum(resident_size(item) for item in obj)
+
+    if torch.is_tensor(obj):
+        return obj.numel() * obj.element_size()
+
+    if isinstance(obj, torch.nn.Module):
+        # state_dict also covers the packed weights of quantized layers
+        return sum(resident_size(value) for value in obj.state_dict().values())
+
+    return 0
+
+class ModelRegistry:
+    """
+    Central place models are loaded from. Each model is loaded on first use,
+    its resident size recorded, and when the total goes over the memory
+    budget the least recently used models are dropped until it fits again.
+    """
+
+    def __init__(self, budget_mb=MODEL_MEMORY_BUDGET_MB):
+        self.budget = budget_mb * 2**20
+        self.loaders = {}
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+        self.load_locks = {}
+
+    def register(self, name, loader, size_fn=resident_size):
+        self.loaders[name] = (loader, size_fn)
+        self.load_locks[name] = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                return self.models[name][0]
+
+        # Loads of one model are serialised, other models stay available meanwhile
+        with self.load_locks[name]:
+            with self.lock:
+                if name in self.models:
+                    self.models.move_to_end(name)
+                    return self.models[name][0]
+
+            loader, size_fn = self.loaders[name]
+            print(f"Loading model {name}")
+            model = loader()
+            size = size_fn(model)
+            print(f"Model {name} loaded ({size / 2**20:.0f} MB)")
+
+            with self.lock:
+                self.models[name] = (model, size)
+                self._evict()
+
+        return model
+
+    def _evict(self):
+        evicted = False
+
+        while self.budget and len(self.models) > 1 and sum(size for _, size in self.models.values()) > self.budget:
+            name, (_, size) = self.models.popitem(last=False)
+            print(f"Evicting model {name} ({size / 2**20:.0f} MB)")
+            evicted = True
+
+        if evicted:
+            gc.collect()
+
+    def sizes(self):
+        with self.lock:
+            return {name: size for name, (_, size) in self.models.items()}
+
+registry = ModelRegistry()
@@ -0,0 +1,115 @@
+import os
+import traceback
+import numpy as np
+import torch
+import onnxruntime as ort
+
+from types import SimpleNamespace
+from decouple import config
+
+from .quantization import MODEL_CACHE_PATH, MODEL_VARIANT, load_model_variant
+
+W2V_BACKEND = config("W2V_BACKEND", default="torch")
+# 0 lets ONNX Runtime use one thread per physical core
+ORT_INTRA_OP_THREADS = config("ORT_INTRA_OP_THREADS", default=0, cast=int)
+ORT_INTER_OP_THREADS = config("ORT_INTER_OP_THREADS", default=1, cast=int)
+
+class LogitsOnly(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values):
+        return self.model(input_values).logits
+
+class OnnxCTCModel:
+    """
+    Stand-in for a Wav2Vec2ForCTC model backed by an ONNX Runtime session.
+    Calling it returns an object with .logits, like the PyTorch model, so
+    callers do not need to know which backend is in use.
+    """
+
+    def __init__(self, session, path=None):
+        self.session = session
+        self.path = path
+
+    def __call__(self, input_values, attention_mask=None, **kwargs):
+        # Inputs are single utterances, so the attention mask is all ones
+        logits, = self.session.run(["logits"], {"input_values": input_values.cpu().numpy().astype(np.float32)})
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def resident_size(self):
+        # Initializers are held in memory at roughly their size on disk
+        return os.path.getsize(self.path) if self.path else 0
+
+def export_ctc_model(model, path):
+    model.eval()
+    tmp_path = f"{path}.tmp"
+
+    torch.onnx.export(
+        LogitsOnly(model),
+        (torch.zeros(1, 16000),),
+        tmp_path,
+        input_names=["input_values"],
+        output_names=["logits"],
+        dynamic_axes={"input_values": {0: "batch", 1: "samples"}, "logits": {0: "batch", 1: "frames"}},
+        opset_version=17
+    )
+    os.replace(tmp_path, path)
+
+def create_session(path):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    options.inter_op_num_threads = ORT_INTER_OP_THREADS
+
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+def onnx_path(name, build):
+    """
+    Exports build() to MODEL_CACHE_PATH once; the int8 variant is quantized
+    from the fp32 export with ONNX Runtime's own dynamic quantization.
+    """
+    path = os.path.join(MODEL_CACHE_PATH, f"{name}.onnx")
+
+    if not os.path.exists(path):
+        print(f"Exporting {name} to ONNX")
+        os.makedirs(MODEL_CACHE_PATH, exist_ok=True)
+        export_ctc_model(build(), path)
+
+    if MODEL_VARIANT != "int8":
+        return path
+
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = os.path.join(MODEL_CACHE_PATH, f"{name}-int8.onnx")
+    if not os.path.exists(int8_path):
+        print(f"Quantizing {name} ONNX model")
+        quantize_dynamic(path, int8_path, weight_type=QuantType.QInt8)
+
+    return int8_path
+
+def load_ctc_model(name, build, device="cpu", backend=W2V_BACKEND):
+    """
+    Loads a Wav2Vec2ForCTC model with the configured backend. Falls back to
+    PyTorch when the ONNX backend is not selected, not on CPU, or fails.
+    """
+    if backend == "onnx" and device == "cpu":
+        try:
+            path = onnx_path(name, build)
+            session = create_session(path)
+            print(f"Running {name} with ONNX Runtime")
+            return OnnxCTCModel(session, path)
+        except Exception:
+            # Still serve requests, but make a broken backend obvious in the logs
+            traceback.print_exc()
+            print(f"Warning: ONNX Runtime backend failed for {name}, using PyTorch")
+
+    return load_model_variant(name, build, device)
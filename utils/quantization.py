@@ -0,0 +1,48 @@
+import os
+import torch
+
+from decouple import config
+
+ROOT_PATH = config("ROOT_PATH")
+MODEL_VARIANT = config("MODEL_VARIANT", default="fp32")
+MODEL_CACHE_PATH = config("MODEL_CACHE_PATH", default=f"{ROOT_PATH}/model_cache")
+
+def quantize_linear_layers(model):
+    """
+    Dynamic int8 quantization of every Linear layer. Model code often
+    subclasses nn.Linear only to cast dtypes (Whisper does), which the
+    quantized Linear refuses to convert, so those are turned back into plain
+    nn.Linear first. torch's own subclasses are left alone on purpose.
+    """
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and not type(module).__module__.startswith("torch."):
+            module.__class__ = torch.nn.Linear
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_model_variant(name, build, device="cpu", variant=MODEL_VARIANT):
+    """
+    Returns build() as is for the fp32 variant. For int8 the quantized model
+    is cached under MODEL_CACHE_PATH, so later starts skip the fp32 load.
+    Dynamic quantization only runs on CPU.
+    """
+    if variant != "int8":
+        return build()
+
+    if device != "cpu":
+        print(f"Warning: int8 {name} is CPU only, loading fp32 for {device}")
+        return build()
+
+    path = os.path.join(MODEL_CACHE_PATH, f"{name}-int8.pt")
+
+    if os.path.exists(path):
+        print(f"Loading quantized {name} from {path}")
+        model = torch.load(path, map_location="cpu", weights_only=False)
+    else:
+        print(f"Quantizing {name}")
+        model = quantize_linear_layers(build())
+        os.makedirs(MODEL_CACHE_PATH, exist_ok=True)
+        torch.save(model, path)
+
+    model.eval()
+    return model
@@ -0,0 +1,160 @@
+"""
+Accuracy and latency comparison of the fp32 and int8 model variants.
+
+    python -m utils.quantization_report eval/manifest.tsv --output quantization_report.md
+
+The manifest is a fixed evaluation set with one "<wav path>\t<reference text>"
+per line. Whisper and the classroom wav2vec model are scored by word error
+rate against the reference, the MMS phoneme model by phoneme error rate
+against the espeak phonemization of the reference.
+
+Only this tool lives in the repository. The evaluation set is recordings of
+children reading and is not shipped with the code, so neither the manifest
+nor a generated report is committed. Run it against the fixed set on a
+machine with the models and keep the output with that set, then use the
+figures to choose MODEL_VARIANT.
+"""
+import io
+import time
+import argparse
+import numpy as np
+import librosa
+import torch
+import whisper
+
+from decouple import config
+from transformers import AutoProcessor, AutoModelForCTC
+
+from .compare import normalize_text
+from .quantization import quantize_linear_layers
+from .mispronunciation_detection.LoadModel import LoadModel
+from .mispronunciation_detection.Transcribe import Transcribe
+
+MMS_PATH = config("MMS_PATH")
+CLASSROOM_MODEL = "aadel4/Wav2vec_Classroom_FT"
+
+def edit_distance(ref, hyp):
+    previous = list(range(len(hyp) + 1))
+    for i in range(1, len(ref) + 1):
+        current = [i] + [0] * len(hyp)
+        for j in range(1, len(hyp) + 1):
+            cost = 0 if ref[i - 1] == hyp[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+        previous = current
+    return previous[-1]
+
+def model_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+def load_manifest(path):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            wav_path, reference = line.rstrip("\n").split("\t", 1)
+            audio, _ = librosa.load(wav_path, sr=16000)
+            items.append((wav_path, audio, reference))
+    return items
+
+def whisper_runner():
+    def run(model, wav_path, audio, reference):
+        text = model.transcribe(audio, language="en", fp16=False)["text"]
+        return normalize_text(reference), normalize_text(text)
+
+    return lambda: whisper.load_model("small", device="cpu"), run
+
+def classroom_runner():
+    processor = AutoProcessor.from_pretrained(CLASSROOM_MODEL)
+
+    def run(model, wav_path, audio, reference):
+        inputs = processor(audio, sampling_rate=16000, return_tensors="pt", padding=True)
+        with torch.no_grad():
+            logits = model(**inputs).logits
+        text = processor.batch_decode(torch.argmax(logits, dim=-1))[0]
+        return normalize_text(reference), normalize_text(text)
+
+    return lambda: AutoModelForCTC.from_pretrained(CLASSROOM_MODEL), run
+
+def mms_runner():
+    loader = LoadModel(MMS_PATH, device="cpu")
+    processor = AutoProcessor.from_pretrained(MMS_PATH)
+
+    def run(model, wav_path, audio, reference):
+        transcriber = Transcribe(model, processor, device="cpu")
+        text = " ".join(normalize_text(reference))
+        gt, pred = transcriber.transcribe_audio(audio, phonemize_gt=True, ground_truth_text=text)
+        return [p for word in gt for p in word], [p for word in pred for p in word]
+
+    return loader._build_model, run
+
+RUNNERS = {
+    "whisper-small": whisper_runner,
+    "classroom-w2v": classroom_runner,
+    "mms-phoneme": mms_runner,
+}
+
+def evaluate(build, run, items, variant):
+    model = build()
+    if variant == "int8":
+        model = quantize_linear_layers(model)
+    model.eval()
+
+    # The first call pays for lazy initialisation, keep it out of the timings
+    run(model, *items[0])
+
+    errors = 0
+    length = 0
+    latencies = []
+
+    for item in items:
+        start = time.perf_counter()
+        ref, hyp = run(model, *item)
+        latencies.append(time.perf_counter() - start)
+
+        errors += edit_distance(ref, hyp)
+        length += len(ref)
+
+    return {
+        "error_rate": errors / max(length, 1),
+        "mean_latency": float(np.mean(latencies)),
+        "p90_latency": float(np.percentile(latencies, 90)),
+        "size_mb": model_size_mb(model),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("manifest")
+    parser.add_argument("--models", nargs="+", default=list(RUNNERS), choices=list(RUNNERS))
+    parser.add_argument("--output", default="quantization_report.md")
+    args = parser.parse_args()
+
+    items = load_manifest(args.manifest)
+    print(f"Loaded {len(items)} evaluation items")
+
+    lines = [
+        f"# fp32 vs int8 ({len(items)} items from {args.manifest})",
+        "",
+        "| model | variant | error rate | mean latency (s) | p90 latency (s) | size (MB) |",
+        "|---|---|---|---|---|---|",
+    ]
+
+    for name in args.models:
+        build, run = RUNNERS[name]()
+        for variant in ("fp32", "int8"):
+            print(f"Evaluating {name} ({variant})")
+            r = evaluate(build, run, items, variant)
+            lines.append(
+                f"| {name} | {variant} | {r['error_rate']:.3f} | {r['mean_latency']:.3f} "
+                f"| {r['p90_latency']:.3f} | {r['size_mb']:.0f} |"
+            )
+
+    report = "\n".join(lines) + "\n"
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+
+from collections import OrderedDict
+from decouple import config
+
+ROOT_PATH = config("ROOT_PATH")
+RESULT_CACHE_MEMORY_MB = config("RESULT_CACHE_MEMORY_MB", default=64, cast=int)
+# 0 disables the disk tier
+RESULT_CACHE_DISK_MB = config("RESULT_CACHE_DISK_MB", default=512, cast=int)
+RESULT_CACHE_PATH = config("RESULT_CACHE_PATH", default=f"{ROOT_PATH}/result_cache")
+
+# Bump when a pipeline change makes earlier results stale
+RESULT_CACHE_VERSION = 1
+
+def cache_key(paragraphs, **params):
+    """
+    sha256 of the decoded PCM of every paragraph plus the parameters that
+    shape the result, so a re-upload of the same recording maps to the same
+    entry whatever container it came in.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"version": RESULT_CACHE_VERSION, **params}, sort_keys=True).encode())
+
+    for paragraph in paragraphs:
+        if isinstance(paragraph, str):
+            digest.update(paragraph.encode())
+        else:
+            data = paragraph.numpy()
+            digest.update(f"{data.dtype}{data.shape}".encode())
+            digest.update(data.tobytes())
+
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Two tier LRU cache of pipeline results. Both tiers are bounded by the
+    pickled size of their entries: the memory tier keeps the most recently
+    used entries up to memory_mb, the disk tier pickles every entry under path
+    and drops the least recently used files once they exceed disk_mb. File
+    mtimes track recency, so the disk tier survives restarts.
+    """
+
+    def __init__(self, memory_mb=RESULT_CACHE_MEMORY_MB, disk_mb=RESULT_CACHE_DISK_MB, path=RESULT_CACHE_PATH):
+        self.memory_bytes = memory_mb * 2**20
+        self.memory_size = 0
+        self.disk_bytes = disk_mb * 2**20
+        self.path = path
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        if self.disk_bytes:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.pkl")
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key][0]
+
+        if not self.disk_bytes:
+            return None
+
+        try:
+            with open(self._file(key), "rb") as f:
+                data = f.read()
+            value = pickle.loads(data)
+            os.utime(self._file(key))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: dropping unreadable cache entry {key} ({e})")
+            self._remove(self._file(key))
+            return None
+
+        self._remember(key, value, len(data))
+        return value
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, value, len(data))
+
+        if not self.disk_bytes:
+            return
+
+        tmp_path = f"{self._file(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._file(key))
+
+        self._evict()
+
+    def _remember(self, key, value, size):
+        if size > self.memory_bytes:
+            return
+
+        with self.lock:
+            if key in self.memory:
+                self.memory_size -= self.memory.pop(key)[1]
+            self.memory[key] = (value, size)
+            self.memory_size += size
+
+            while self.memory_size > self.memory_bytes:
+                _, (_, evicted_size) = self.memory.popitem(last=False)
+                self.memory_size -= evicted_size
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+result_cache = ResultCache()
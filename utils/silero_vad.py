@@ -1,34 +1,69 @@
 from silero_vad import load_silero_vad, get_speech_timestamps
-from .conversions import convert_webm_to_wav
 
+import asyncio
+import numpy as np
 import torch
 import torchaudio
 
 from decouple import config
 
+from .model_registry import registry
+from .inference_executor import run_inference
+
 ROOT_PATH = config("ROOT_PATH")
+VAD_BATCH_WAIT_MS = config("VAD_BATCH_WAIT_MS", default=5, cast=float)
+VAD_MAX_BATCH = config("VAD_MAX_BATCH", default=64, cast=int)
+
+# The ONNX build is used so streaming sessions can drive the session directly
+# with their own recurrent state instead of the model's shared one.
+registry.register("silero-vad", lambda: load_silero_vad(onnx=True))
+
+WINDOW_SIZE = 512
+CONTEXT_SIZE = 64
+
+def run_windows(vads, windows, sampling_rate=16000):
+    """
+    Runs one window for each streaming VAD as a single batched forward pass and
+    stores the updated recurrent state and context back on each of them.
+    """
+    x = np.stack([np.concatenate((vad.context, window)) for vad, window in zip(vads, windows)])
+    state = np.concatenate([vad.state for vad in vads], axis=1)
+    sr = np.array(sampling_rate, dtype=np.int64)
 
-model = load_silero_vad()
+    out, state = registry.get("silero-vad").session.run(None, {"input": x, "state": state, "sr": sr})
 
-def silero_vad(waveforms, sample_rate, cur_paragraph):
+    for i, (vad, window) in enumerate(zip(vads, windows)):
+        vad.state = state[:, i:i + 1]
+        vad.context = window[-CONTEXT_SIZE:]
 
+    return [float(prob) for prob in out[:, 0]]
+
+def silero_vad(waveforms, sample_rate):
+    """
+    Returns the speech-only audio of each paragraph as a tensor, the indices
+    of paragraphs in which no speech was found, and per paragraph the
+    (start, end) sample offsets of each VAD segment within its speech tensor.
+    """
+    speech = []
     empty = []
+    segments = []
 
     for i, waveform in enumerate(waveforms):
         print(f"Silero VAD: Paragraph #{i+1}")
         
         mono = waveform[0].numpy()
-        speech_timestamps = get_speech_timestamps(mono, model, sampling_rate=sample_rate)
+        speech_timestamps = get_speech_timestamps(mono, registry.get("silero-vad"), sampling_rate=sample_rate)
 
         sliced_audio = []
-
-        num_samples = waveform.shape[1]
-        duration = num_samples / sample_rate
+        paragraph_segments = []
+        offset = 0
 
         for j, timestamp in enumerate(speech_timestamps):
             start_frame = int(timestamp["start"])
             end_frame = int(timestamp["end"])
             sliced_audio.append(waveform[:, start_frame:end_frame])
+            paragraph_segments.append((offset, offset + end_frame - start_frame))
+            offset += end_frame - start_frame
         
         if len(sliced_audio) == 0:
             sliced_audio = torch.zeros((1, 1))
@@ -36,12 +71,135 @@ def silero_vad(waveforms, sample_rate, cur_paragraph):
         else:
             sliced_audio = torch.cat(sliced_audio, dim=1)
 
-        torchaudio.save(f"{ROOT_PATH}/media/paragraph_{cur_paragraph}.wav", sliced_audio, sample_rate)
+        speech.append(sliced_audio)
+        segments.append(paragraph_segments)
 
-    return empty
+    return speech, empty, segments
+
+def save_paragraph_audio(waveform, sample_rate, cur_paragraph):
+    path = f"{ROOT_PATH}/media/paragraph_{cur_paragraph}.wav"
+    torchaudio.save(path, waveform, sample_rate)
+    return path
     
-def silero_vad_steam(audio_bytes):
-    waveform, sample_rate = convert_webm_to_wav(audio_bytes)
-    mono = waveform[0].numpy()
-    speech_timestamps = get_speech_timestamps(mono, model, sampling_rate=sample_rate)
-    return speech_timestamps, waveform
\ No newline at end of file
+class StreamingVAD:
+    """
+    Streaming Silero VAD for one session. Consumes audio in 512 sample windows,
+    carrying the recurrent state and context between calls, and emits
+    {"start": n} / {"end": n} events in absolute samples like VADIterator.
+    Inference goes through VADBatcher.process, which feeds the probabilities
+    of each window back to update.
+    """
+
+    def __init__(self, threshold=0.5, sampling_rate=16000, min_silence_duration_ms=100, speech_pad_ms=30):
+        self.threshold = threshold
+        self.sampling_rate = sampling_rate
+        self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
+        self.speech_pad_samples = sampling_rate * speech_pad_ms / 1000
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros((2, 1, 128), dtype=np.float32)
+        self.context = np.zeros(CONTEXT_SIZE, dtype=np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.current_sample = 0
+        self.triggered = False
+        self.temp_end = 0
+
+    def split(self, samples):
+        """Cuts complete windows off the new samples; the remainder waits for the next call."""
+        samples = np.concatenate((self.pending, samples.astype(np.float32, copy=False)))
+        num_windows = len(samples) // WINDOW_SIZE
+        self.pending = samples[num_windows * WINDOW_SIZE:]
+        return samples[:num_windows * WINDOW_SIZE].reshape(num_windows, WINDOW_SIZE)
+
+    def update(self, probs):
+        events = []
+
+        for prob in probs:
+            self.current_sample += WINDOW_SIZE
+
+            if prob >= self.threshold and self.temp_end:
+                self.temp_end = 0
+
+            if prob >= self.threshold and not self.triggered:
+                self.triggered = True
+                events.append({"start": int(max(0, self.current_sample - self.speech_pad_samples - WINDOW_SIZE))})
+
+            elif prob < self.threshold - 0.15 and self.triggered:
+                if not self.temp_end:
+                    self.temp_end = self.current_sample
+
+                if self.current_sample - self.temp_end >= self.min_silence_samples:
+                    events.append({"end": int(self.temp_end + self.speech_pad_samples - WINDOW_SIZE)})
+                    self.temp_end = 0
+                    self.triggered = False
+
+        return events
+
+class VADBatcher:
+    """
+    Shared VAD service for all streaming sessions of this process. Windows
+    submitted within VAD_BATCH_WAIT_MS are run together, one window per
+    session per forward pass, since each session's windows depend on the
+    state left by the previous one.
+    """
+
+    def __init__(self, max_wait_ms=VAD_BATCH_WAIT_MS, max_batch=VAD_MAX_BATCH):
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.queue = []
+        self.task = None
+
+    async def process(self, vad, samples):
+        windows = vad.split(samples)
+        if len(windows) == 0:
+            return []
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((vad, windows, future))
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+        return vad.update(await future)
+
+    async def _run(self):
+        while self.queue:
+            await asyncio.sleep(self.max_wait)
+            requests, self.queue = self.queue, []
+
+            try:
+                results = await run_inference("vad", self._infer, requests)
+            except Exception as e:
+                for _, _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, _, future), probs in zip(requests, results):
+                if not future.done():
+                    future.set_result(probs)
+
+    def _infer(self, requests):
+        results = [[] for _ in requests]
+        active = list(range(len(requests)))
+        step = 0
+
+        while active:
+            for start in range(0, len(active), self.max_batch):
+                group = active[start:start + self.max_batch]
+                probs = run_windows(
+                    [requests[i][0] for i in group],
+                    [requests[i][1][step] for i in group],
+                    requests[group[0]][0].sampling_rate
+                )
+
+                for i, prob in zip(group, probs):
+                    results[i].append(prob)
+
+            step += 1
+            active = [i for i in active if len(requests[i][1]) > step]
+
+        return results
+
+vad_batcher = VADBatcher()
@@ -0,0 +1,15 @@
+from .InitialParasLinked import run_inital_paras
+from .MatchLinked import run_match
+from .StoryGenLinked import run_story_gen
+from .NoOutlineGenLinked import run_no_outline_gen
+
+def generate_story(mistakes):
+    """
+    Runs the whole story pipeline for the given mistakes. The steps hand over
+    through fixed files under SG_PATH, so callers run it on the "story"
+    inference queue, which has a single worker.
+    """
+    run_inital_paras(mistakes)
+    run_match()
+    run_story_gen()
+    return run_no_outline_gen()
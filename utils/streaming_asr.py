@@ -0,0 +1,74 @@
+import re
+
+from . import kidwhisper
+from .whisper_batching import decode_options
+
+MIN_AUDIO_SECONDS = 0.5
+PROMPT_WORDS = 40
+
+def normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+class StreamingTranscriber:
+    """
+    Streaming Whisper transcription with a committed prefix (local agreement
+    between consecutive hypotheses). Only audio after the last committed word
+    is decoded again, with the committed text as the prompt, so each update
+    costs about the same however long the reading gets. Runs on the draft
+    Whisper tier; the recorded score comes from the final tier.
+    """
+
+    inference_queue = "whisper"
+
+    def __init__(self, offset=0, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.offset = offset
+        self.committed = []
+        self.hypothesis = []
+
+    def text(self):
+        return " ".join(self.committed + [word for _, _, word in self.hypothesis])
+
+    def update(self, buffer, end=None):
+        """
+        Decodes buffer audio from the committed offset up to end and commits
+        the words on which this and the previous hypothesis agree.
+        Returns the committed plus tentative transcript.
+        """
+        start = max(self.offset, buffer.start)
+        audio = buffer.read(start, end)
+
+        if len(audio) < MIN_AUDIO_SECONDS * self.sample_rate:
+            return self.text()
+
+        prompt = " ".join(self.committed[-PROMPT_WORDS:])
+
+        with kidwhisper.model_locks["draft"]:
+            model = kidwhisper.load_model("draft")
+            result = model.transcribe(
+                audio,
+                **decode_options(model),
+                word_timestamps=True,
+                condition_on_previous_text=False,
+                initial_prompt=prompt or None
+            )
+
+        words = [
+            (start + int(word["start"] * self.sample_rate), start + int(word["end"] * self.sample_rate), word["word"].strip())
+            for segment in result["segments"]
+            for word in segment.get("words", [])
+        ]
+
+        agreed = 0
+        while (
+            agreed < len(words) and agreed < len(self.hypothesis)
+            and normalize_word(words[agreed][2]) == normalize_word(self.hypothesis[agreed][2])
+        ):
+            agreed += 1
+
+        if agreed > 0:
+            self.committed += [word for _, _, word in words[:agreed]]
+            self.offset = words[agreed - 1][1]
+
+        self.hypothesis = words[agreed:]
+        return self.text()
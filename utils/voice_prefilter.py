@@ -0,0 +1,85 @@
+import numpy as np
+
+from decouple import config
+
+# A recording counts as a single child voice when every VAD segment has a
+# median pitch above CHILD_MIN_F0, a spectral centroid (which follows the
+# formants up for shorter vocal tracts) above CHILD_MIN_CENTROID, and the
+# segment pitches stay within CHILD_MAX_F0_SPREAD of each other.
+CHILD_MIN_F0 = config("CHILD_MIN_F0", default=250, cast=float)
+CHILD_MIN_CENTROID = config("CHILD_MIN_CENTROID", default=1600, cast=float)
+CHILD_MAX_F0_SPREAD = config("CHILD_MAX_F0_SPREAD", default=1.35, cast=float)
+MIN_VOICED_FRAMES = config("PREFILTER_MIN_VOICED_FRAMES", default=20, cast=int)
+
+FRAME_MS = 40
+HOP_MS = 10
+MIN_F0 = 70
+MAX_F0 = 600
+VOICING_THRESHOLD = 0.5
+
+def frame_features(samples, sample_rate):
+    """
+    Returns per frame (f0, voiced, centroid) arrays for a mono float array.
+    """
+    frame = int(sample_rate * FRAME_MS / 1000)
+    hop = int(sample_rate * HOP_MS / 1000)
+
+    if len(samples) < frame:
+        empty = np.zeros(0)
+        return empty, empty.astype(bool), empty
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop]
+    frames = (frames - frames.mean(axis=1, keepdims=True)) * np.hanning(frame)
+
+    spectrum = np.fft.rfft(frames, n=2 * frame, axis=1)
+    power = np.abs(spectrum) ** 2
+
+    # Autocorrelation via the power spectrum, normalised by the zero lag
+    autocorr = np.fft.irfft(power, axis=1)[:, :frame]
+    energy = autocorr[:, 0]
+    autocorr = autocorr / np.maximum(energy[:, None], 1e-10)
+
+    min_lag = int(sample_rate / MAX_F0)
+    max_lag = min(int(sample_rate / MIN_F0), frame - 1)
+    lags = np.argmax(autocorr[:, min_lag:max_lag], axis=1) + min_lag
+    strength = autocorr[np.arange(len(frames)), lags]
+
+    loud = energy > 0.05 * energy.max()
+    voiced = (strength > VOICING_THRESHOLD) & loud
+    f0 = sample_rate / lags
+
+    freqs = np.fft.rfftfreq(2 * frame, 1 / sample_rate)
+    band = freqs <= 5000
+    band_power = power[:, band]
+    centroid = (band_power * freqs[band]).sum(axis=1) / np.maximum(band_power.sum(axis=1), 1e-10)
+
+    return f0, voiced, centroid
+
+def is_single_child(waveform, segments, sample_rate):
+    """
+    Cheap check whether all speech in waveform comes from one child.
+    segments are (start, end) sample offsets of the VAD segments in waveform.
+    Only returns True when confident; ambiguous audio goes to the full VTC.
+    """
+    samples = waveform.reshape(-1).numpy().astype(np.float64)
+    f0_medians = []
+
+    for start, end in segments:
+        f0, voiced, centroid = frame_features(samples[start:end], sample_rate)
+
+        # Too little voicing to tell whose speech it is
+        if voiced.sum() < MIN_VOICED_FRAMES:
+            return False
+
+        f0_median = np.median(f0[voiced])
+        centroid_median = np.median(centroid[voiced])
+
+        if f0_median < CHILD_MIN_F0 or centroid_median < CHILD_MIN_CENTROID:
+            return False
+
+        f0_medians.append(f0_median)
+
+    if len(f0_medians) == 0:
+        return False
+
+    return max(f0_medians) / min(f0_medians) <= CHILD_MAX_F0_SPREAD
@@ -1,17 +1,30 @@
+import os
+import json
+import time
+import atexit
+import socket
+import struct
 import subprocess
+import threading
+import numpy as np
 import torch
-import torchaudio
 
 from decouple import config
+from .voice_prefilter import is_single_child
 
 ROOT_PATH = config("ROOT_PATH")
 VTC_PATH = config("VTC_PATH")
 CONDA_PATH = config("CONDA_PATH")
+VTC_SOCKET = config("VTC_SOCKET", default=f"{ROOT_PATH}/vtc.sock")
+VTC_STARTUP_TIMEOUT = config("VTC_STARTUP_TIMEOUT", default=300, cast=int)
+VTC_REQUEST_TIMEOUT = config("VTC_REQUEST_TIMEOUT", default=120, cast=float)
 
 env_name = "pyannote"
-wav_path = f"{ROOT_PATH}/media"
-script_path = f"{VTC_PATH}/apply.sh"
-command = f"source {CONDA_PATH}/etc/profile.d/conda.sh && conda init && conda activate {env_name} && {script_path} {wav_path}"
+worker_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vtc_worker.py")
+worker_command = f"source {CONDA_PATH}/etc/profile.d/conda.sh && conda activate {env_name} && exec python {worker_path} --socket {VTC_SOCKET} --vtc {VTC_PATH}"
+
+# Same framing as utils/vtc_worker.py
+LENGTH = struct.Struct("!I")
 
 categories = {
     "Male": "MAL",
@@ -19,55 +32,124 @@ categories = {
     "Child": "KCHI"
 }
 
-def get_ith_command(i):
-    return f"source {CONDA_PATH}/etc/profile.d/conda.sh && conda init && conda activate {env_name} && {script_path} {wav_path}/paragraph_{i}.wav"
-
-def voice_type_classifier(empty, voice_type, cur_paragraph):
+worker = None
+worker_lock = threading.Lock()
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("VTC worker closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+def send_message(sock, payload):
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+def connect_worker():
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(VTC_REQUEST_TIMEOUT)
+    try:
+        sock.connect(VTC_SOCKET)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def start_worker():
+    """
+    Starts the resident VTC worker in the pyannote environment if it is not
+    reachable yet, and waits until it accepts connections.
+    """
+    global worker
+
+    with worker_lock:
+        try:
+            connect_worker().close()
+            return
+        except OSError:
+            pass
+
+        if worker is None or worker.poll() is not None:
+            print("Starting VTC worker")
+            worker = subprocess.Popen(["bash", "-c", worker_command], executable="/bin/bash")
+
+        deadline = time.time() + VTC_STARTUP_TIMEOUT
+        while time.time() < deadline:
+            # Exit status 0 means another process's worker holds the socket
+            # and is still loading, so keep waiting for it
+            if worker.poll() not in (None, 0):
+                raise RuntimeError(f"VTC worker exited with code {worker.returncode}")
+            try:
+                connect_worker().close()
+                return
+            except OSError:
+                time.sleep(0.5)
+
+        raise TimeoutError("VTC worker did not start in time")
+
+@atexit.register
+def stop_worker():
+    if worker is not None and worker.poll() is None:
+        worker.terminate()
+
+def classify_voice_types(waveform, sample_rate):
+    """
+    Returns [[start, end, label], ...] in seconds for a mono or (1, n) waveform.
+    Raises socket.timeout if the worker takes longer than VTC_REQUEST_TIMEOUT.
+    """
+    samples = np.ascontiguousarray(waveform.reshape(-1).numpy(), dtype="<f4")
+    header = json.dumps({"sample_rate": sample_rate, "num_samples": len(samples)}).encode()
+
+    try:
+        sock = connect_worker()
+    except OSError:
+        start_worker()
+        sock = connect_worker()
+
+    with sock:
+        send_message(sock, header)
+        send_message(sock, samples.tobytes())
+        size, = LENGTH.unpack(recv_exact(sock, LENGTH.size))
+        response = json.loads(recv_exact(sock, size).decode())
+
+    if "error" in response:
+        raise RuntimeError(f"VTC worker error: {response['error']}")
+
+    return response["segments"]
+
+def voice_type_classifier(speech, empty, voice_type, cur_paragraph, sample_rate, segments=None):
     paragraphs = []
 
-    for i in range(1):            
+    for i in range(1):
         print(f"VTC: Paragraph #{i+1}")
 
         if i in empty:
             paragraphs.append("empty")
             continue
 
-        command = get_ith_command(cur_paragraph)
-
-        result = subprocess.run(
-            ["bash", "-c", command],
-            capture_output=True,
-            text=True,
-            executable="/bin/bash"
-        )
-
-        print("STDOUT:")
-        print(result.stdout)
-
-        print("STDERR:")
-        print(result.stderr)
+        waveform = speech[i]
 
-        segments = []
-
-        with open(f"{ROOT_PATH}/output_voice_type_classifier/paragraph_{cur_paragraph}/all.rttm") as file:
-            for line in file:
-                line = line.strip().split(" ")
-                category = line[7]
+        # Most readings are one child on their own; skip the model when the
+        # pitch based pre-filter is already sure of that.
+        if voice_type == "Child" and segments is not None and is_single_child(waveform, segments[i], sample_rate):
+            print("VTC: single child voice, skipping model")
+            paragraphs.append(waveform)
+            continue
 
-                if category == categories[voice_type]:
-                    segments.append([float(line[3]), float(line[4])])
+        voice_segments = [
+            [start, end] for start, end, label in classify_voice_types(waveform, sample_rate)
+            if label == categories[voice_type]
+        ]
 
-        waveform, sample_rate = torchaudio.load(f"{ROOT_PATH}/media/paragraph_{cur_paragraph}.wav")
         sliced_audio = []
 
-        num_samples = waveform.shape[1]
-        duration = num_samples / sample_rate
-
-        for i, timestamp in enumerate(segments):
+        for j, timestamp in enumerate(voice_segments):
             start_frame = int(timestamp[0] * sample_rate)
             end_frame = int(timestamp[1] * sample_rate)
             sliced_audio.append(waveform[:, start_frame:end_frame])
-        
+
 
         if len(sliced_audio) == 0:
             sliced_audio = torch.zeros((1, 1))
@@ -77,5 +159,5 @@ def voice_type_classifier(empty, voice_type, cur_paragraph):
             sliced_audio = torch.cat(sliced_audio, dim=1)
 
         paragraphs.append(sliced_audio)
-        
-    return paragraphs
\ No newline at end of file
+
+    return paragraphs
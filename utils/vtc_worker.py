@@ -0,0 +1,134 @@
+"""
+Resident voice type classifier worker.
+
+Runs inside the pyannote conda environment of the voice-type-classifier
+checkout, loads the model once and answers classification requests over a
+local Unix socket, so callers only pay for inference.
+
+Protocol (every message is a 4 byte big-endian length followed by the payload):
+    request:  JSON header {"sample_rate": int, "num_samples": int},
+              then the mono float32 little-endian samples
+    response: JSON {"segments": [[start, end, label], ...]} or {"error": str}
+
+Only one worker serves a socket: it holds an exclusive lock on
+"<socket>.lock" for its lifetime, and a second worker started for the same
+socket exits right away with status 0.
+"""
+import argparse
+import fcntl
+import json
+import os
+import sys
+import socketserver
+import struct
+
+import numpy as np
+import yaml
+
+from pyannote.audio.features import Pretrained
+from pyannote.audio.utils.signal import Binarize
+from pyannote.core import SlidingWindowFeature
+
+LENGTH = struct.Struct("!I")
+
+VALIDATE_DIR = (
+    "model/train/X.SpeakerDiarization.BBT2_LeaveOneDomainOut.train/"
+    "validate_average_detection_fscore/X.SpeakerDiarization.BBT2_LeaveOneDomainOut.development"
+)
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Connection closed mid message")
+        data.extend(chunk)
+    return bytes(data)
+
+def recv_message(sock):
+    size, = LENGTH.unpack(recv_exact(sock, LENGTH.size))
+    return recv_exact(sock, size)
+
+def send_message(sock, payload):
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+class VoiceTypeClassifier:
+    def __init__(self, vtc_path, device="cpu", batch_size=32):
+        validate_dir = os.path.join(vtc_path, VALIDATE_DIR)
+        self.model = Pretrained(validate_dir=validate_dir, batch_size=batch_size, device=device)
+        self.sample_rate = self.model.sample_rate
+        self.binarizers = {}
+
+        # Per class thresholds tuned on the development set, if shipped
+        params_path = os.path.join(validate_dir, "params.yml")
+        params = {}
+        if os.path.exists(params_path):
+            with open(params_path) as f:
+                params = yaml.safe_load(f).get("params", {})
+
+        for label in self.model.classes:
+            label_params = params.get(label, {})
+            self.binarizers[label] = Binarize(
+                onset=label_params.get("onset", 0.5),
+                offset=label_params.get("offset", 0.5),
+                min_duration_on=label_params.get("min_duration_on", 0.0),
+                min_duration_off=label_params.get("min_duration_off", 0.0),
+            )
+
+    def classify(self, samples):
+        scores = self.model({"uri": "stream", "waveform": samples.reshape(-1, 1)})
+        segments = []
+
+        for k, label in enumerate(self.model.classes):
+            label_scores = SlidingWindowFeature(scores.data[:, k:k + 1], scores.sliding_window)
+            for segment in self.binarizers[label].apply(label_scores, dimension=0):
+                segments.append([segment.start, segment.end, label])
+
+        return sorted(segments)
+
+class Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            header = json.loads(recv_message(self.request).decode())
+            samples = np.frombuffer(recv_message(self.request), dtype="<f4")
+
+            if header["sample_rate"] != self.server.classifier.sample_rate:
+                raise ValueError(f"Expected {self.server.classifier.sample_rate} Hz audio, got {header['sample_rate']} Hz")
+            if len(samples) != header["num_samples"]:
+                raise ValueError("Sample count does not match the header")
+
+            response = {"segments": self.server.classifier.classify(samples)}
+        except Exception as e:
+            response = {"error": str(e)}
+
+        send_message(self.request, json.dumps(response).encode())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--vtc", required=True, help="voice-type-classifier checkout")
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    # Several Django processes may start a worker at once; the lock holder
+    # owns the socket, so only it may remove a stale one and bind
+    lock_file = open(f"{args.socket}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print(f"VTC worker already serving {args.socket}, exiting")
+        sys.exit(0)
+
+    # Load before binding so the socket only appears once requests can be served
+    classifier = VoiceTypeClassifier(args.vtc, device=args.device)
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+
+    server = socketserver.UnixStreamServer(args.socket, Handler)
+    server.classifier = classifier
+    print(f"VTC worker listening on {args.socket}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
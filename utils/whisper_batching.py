@@ -0,0 +1,179 @@
+import time
+import queue
+import bisect
+import threading
+import numpy as np
+import torch
+import whisper
+
+from concurrent.futures import Future
+from decouple import config
+from whisper.timing import find_alignment
+from whisper.tokenizer import get_tokenizer
+
+WHISPER_MAX_BATCH = config("WHISPER_MAX_BATCH", default=8, cast=int)
+WHISPER_MAX_WAIT_MS = config("WHISPER_MAX_WAIT_MS", default=50, cast=float)
+# Utterances packed into one 30 s window, 1 disables packing
+WHISPER_MAX_PACK = config("WHISPER_MAX_PACK", default=4, cast=int)
+WHISPER_PACK_GAP_SECONDS = config("WHISPER_PACK_GAP_SECONDS", default=1.0, cast=float)
+
+# The thresholds model.transcribe uses by default
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+def decode_options(model):
+    """Options every Whisper call shares, so the batched and long audio paths agree."""
+    return {"language": "en", "fp16": model.device.type == "cuda"}
+
+def pack(lengths, gap, max_pack=WHISPER_MAX_PACK, window=whisper.audio.N_SAMPLES):
+    """
+    Packs utterances of the given lengths, in order, into windows of at most
+    window samples with gap samples of silence between them. Returns a list
+    of windows, each a list of (index, start sample within the window).
+    """
+    windows = []
+    used = window
+
+    for i, length in enumerate(lengths):
+        start = used + gap
+        if len(windows) == 0 or len(windows[-1]) >= max_pack or start + length > window:
+            windows.append([])
+            start = 0
+
+        windows[-1].append((i, start))
+        used = start + length
+
+    return windows
+
+def split_words(words, spans):
+    """
+    Splits word timings back over the utterances of a packed window. Each word
+    goes to the utterance whose span (start, end in seconds) its midpoint is in,
+    with the silence between two utterances divided at its middle.
+    """
+    boundaries = [(end + next_start) / 2 for (_, end), (next_start, _) in zip(spans, spans[1:])]
+    texts = [[] for _ in spans]
+
+    for word in words:
+        texts[bisect.bisect(boundaries, (word.start + word.end) / 2)].append(word.word)
+
+    return ["".join(text).strip() for text in texts]
+
+class WhisperBatcher:
+    """
+    In-process batching server for Whisper. Callers submit audio of at most
+    30 seconds and get a Future; a scheduler thread gathers the submissions
+    that arrive within max_wait_ms of the first one and decodes them in a
+    single batched encoder + decoder pass. Since every window is padded to
+    30 seconds anyway, short utterances are packed together into one window
+    with silence in between, and the text is split back per utterance from
+    the word timings. Windows that fail transcribe's quality checks (too
+    repetitive or too unlikely) are transcribed again one utterance at a time
+    with transcribe's temperature fallback, and windows it would skip as no
+    speech come back empty. The model is fetched through get_model for every
+    batch so it may be evicted in between.
+    """
+
+    def __init__(
+        self,
+        get_model,
+        max_batch=WHISPER_MAX_BATCH,
+        max_wait_ms=WHISPER_MAX_WAIT_MS,
+        max_pack=WHISPER_MAX_PACK,
+        gap_seconds=WHISPER_PACK_GAP_SECONDS,
+        lock=None
+    ):
+        self.get_model = get_model
+        self.lock = lock or threading.Lock()
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_pack = max(1, max_pack)
+        self.gap = int(gap_seconds * whisper.audio.SAMPLE_RATE)
+        self.queue = queue.Queue()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, audio):
+        if len(audio) > whisper.audio.N_SAMPLES:
+            raise ValueError("WhisperBatcher only takes audio of up to 30 seconds")
+
+        future = Future()
+        self.queue.put((np.asarray(audio, dtype=np.float32), future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch * self.max_pack:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            windows = pack([len(audio) for audio, _ in batch], self.gap, self.max_pack)
+
+            for start in range(0, len(windows), self.max_batch):
+                self._decode([[(batch[i], offset) for i, offset in window] for window in windows[start:start + self.max_batch]])
+
+    def _decode(self, windows):
+        print(f"Whisper: decoding {sum(len(window) for window in windows)} utterances in {len(windows)} windows")
+
+        try:
+            model = self.get_model()
+            options = whisper.DecodingOptions(without_timestamps=True, **decode_options(model))
+            mels = torch.stack([self._mel(model, window) for window in windows]).to(model.device)
+
+            with self.lock, torch.no_grad():
+                results = whisper.decode(model, mels, options)
+
+                texts = [self._texts(model, window, mel, result) for window, mel, result in zip(windows, mels, results)]
+        except Exception as e:
+            for window in windows:
+                for (_, future), _ in window:
+                    future.set_exception(e)
+            return
+
+        for window, window_texts in zip(windows, texts):
+            for ((_, future), _), text in zip(window, window_texts):
+                future.set_result(text)
+
+    def _texts(self, model, window, mel, result):
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            return ["" for _ in window]
+
+        if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+            print("Whisper: batched decode failed the quality checks, falling back to transcribe")
+            return [
+                model.transcribe(samples, **decode_options(model))["text"]
+                for (samples, _), _ in window
+            ]
+
+        if len(window) > 1:
+            return self._split(model, window, mel, result)
+        return [result.text]
+
+    def _mel(self, model, window):
+        audio = np.zeros(whisper.audio.N_SAMPLES, dtype=np.float32)
+        for (samples, _), start in window:
+            audio[start:start + len(samples)] = samples
+
+        return whisper.log_mel_spectrogram(torch.from_numpy(audio), n_mels=model.dims.n_mels)
+
+    def _split(self, model, window, mel, result):
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language="en", task="transcribe")
+        (last, _), last_start = window[-1]
+        num_frames = (last_start + len(last)) // whisper.audio.HOP_LENGTH
+
+        words = find_alignment(model, tokenizer, result.tokens, mel, num_frames)
+        spans = [
+            (start / whisper.audio.SAMPLE_RATE, (start + len(samples)) / whisper.audio.SAMPLE_RATE)
+            for (samples, _), start in window
+        ]
+        return split_words(words, spans)